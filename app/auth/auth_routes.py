@@ -2,32 +2,24 @@ from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel
 from datetime import datetime, timedelta
-from random import randint
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import africastalking
-from app.config import (BREVO_SMTP_USERNAME, BREVO_SMTP_SERVER, BREVO_SMTP_PORT, BREVO_SMTP_PASSWORD, AT_USERNAME, AT_API_KEY, SMTP_FROM_EMAIL)
-
-from app.models import User, OTP, session
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import User, get_async_db
+from app.auth.otp_service import otp_store, OTP_VALID, OTP_EXPIRED, OTP_LOCKED
+from app.auth.revocation import token_revocations
+from app.notifications import enqueue_notification, notification_dispatcher
 from app.auth.auth_service import (
     hash_password,
     authenticate_user,
     create_access_token,
     register_user,
+    invalidate_cached_user,
+    jwt_handler,
+    oauth2_scheme,
 )
 
 router = APIRouter()
-db = session()
-
-
-# ---------------- SMS INIT ----------------
-try:
-    africastalking.initialize(AT_USERNAME, AT_API_KEY)
-    sms = africastalking.SMS()
-except Exception as e:
-    print("Africastalking init failed:", e)
-    sms = None
 
 # ---------------- SCHEMAS ----------------
 class UserRegisterRequest(BaseModel):
@@ -51,15 +43,16 @@ class ResetPasswordRequest(BaseModel):
 
 # ---------------- REGISTER ----------------
 @router.post("/register", tags=["auth"])
-def register(user: UserRegisterRequest):
+async def register(user: UserRegisterRequest, db: AsyncSession = Depends(get_async_db)):
     try:
-        new_user = register_user(
+        new_user = await register_user(
+            db,
             user.full_name,
             user.email,
             user.password,
         )
         print("User-------", new_user.email)
-        token = create_access_token(new_user.email)
+        token = create_access_token(new_user.email, user_id=new_user.id)
         print("Token -------", token)
         return {
             "access_token": token,
@@ -70,18 +63,20 @@ def register(user: UserRegisterRequest):
                 "full_name": new_user.full_name,
             },
         }
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
 
 # ---------------- LOGIN (JSON – FRONTEND) ----------------
 @router.post("/login", tags=["auth"])
-def login(data: LoginRequest):
-    user = authenticate_user(data.email, data.password)
+async def login(data: LoginRequest, db: AsyncSession = Depends(get_async_db)):
+    user = await authenticate_user(db, data.email, data.password)
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    token = create_access_token(user.email)
+    token = create_access_token(user.email, user_id=user.id)
     return {
         "access_token": token,
         "token_type": "bearer",
@@ -94,17 +89,29 @@ def login(data: LoginRequest):
 
 # ---------------- LOGIN (OAUTH2 – SWAGGER) ----------------
 @router.post("/token", tags=["auth"])
-def login_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(form_data.username, form_data.password)
+async def login_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    token = create_access_token(user.email)
+    token = create_access_token(user.email, user_id=user.id)
     return {
         "access_token": token,
         "token_type": "bearer",
     }
 
+# ---------------- LOGOUT ----------------
+# Revokes the presented token; other workers stop accepting it on their next revocation refresh
+@router.post("/logout", tags=["auth"])
+async def logout(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    payload = jwt_handler.decode_token(token)
+    if not payload:
+        raise HTTPException(status_code=401, detail="Invalid token", headers={"WWW-Authenticate": "Bearer"})
+
+    await token_revocations.revoke_token(db, payload)
+    await db.commit()
+    return {"message": "Logged out"}
+
 # ---------------- FORGOT PASSWORD ----------------
 # @router.post("/forgot-password", tags=["auth"])
 # def forgot_password(data: ForgotPasswordRequest, db : Session = Depends(get_db)):
@@ -166,84 +173,74 @@ def login_token(form_data: OAuth2PasswordRequestForm = Depends()):
 #     return {"message": "OTP verified"}
 
 @router.post("/forgot-password", tags=["auth"])
-def forgot_password(data: ForgotPasswordRequest):
-    db = session()
+async def forgot_password(data: ForgotPasswordRequest, db: AsyncSession = Depends(get_async_db)):
+    method = data.method.lower()
+    identifier = data.identifier
+    print("Forgot password request-----", method, identifier)
+
+    if method == "email":
+        user = await db.scalar(select(User).where(
+            User.email == identifier
+        ).limit(1))
+
+    elif method == "sms":
+        user = await db.scalar(select(User).where(
+            User.phone == identifier
+        ).limit(1))
+
+    else:
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid method"
+        )
 
-    try:
-        method = data.method.lower()
-        identifier = data.identifier
-        print("Forgot password request-----", method, identifier)
-
-        if method == "email":
-            user = db.query(User).filter(
-                User.email == identifier
-            ).first()
-
-        elif method == "sms":
-            user = db.query(User).filter(
-                User.phone == identifier
-            ).first()
-
-        else:
-            raise HTTPException(
-                status_code=400,
-                detail="Invalid method"
-            )
-
-        if not user:
-            raise HTTPException(
-                status_code=404,
-                detail="User not found"
-            )
-
-        otp_code = str(randint(1000, 9999))
-
-        db.add(
-            OTP(
-                user_id=user.id,
-                otp=otp_code,
-                created_at=datetime.utcnow()
-            )
+    if not user:
+        raise HTTPException(
+            status_code=404,
+            detail="User not found"
         )
 
-        db.commit()
-        print("otp saved to the database successfully------", otp_code)
+    # Replaces any earlier code for this user
+    otp_code = await otp_store.issue(db, user.id)
 
-        if method == "email":
-            msg = MIMEMultipart()
-            msg["From"] = SMTP_FROM_EMAIL
-            msg["To"] = user.email
-            msg["Subject"] = "Password Reset OTP"
-            msg.attach(MIMEText(f"Your OTP is {otp_code}", "plain"))
-            print("Server------",BREVO_SMTP_SERVER)
-            print("Port------",BREVO_SMTP_PORT)
-            print("Username------",BREVO_SMTP_USERNAME)
+    # Queue the OTP in the outbox; it is committed with the OTP and sent by the dispatcher
+    if method == "email":
+        enqueue_notification(db, "email", user.email, f"Your OTP is {otp_code}", subject="Password Reset OTP")
+    else:
+        enqueue_notification(db, "sms", user.phone, f"Your OTP is {otp_code}")
 
-            server = smtplib.SMTP(BREVO_SMTP_SERVER, BREVO_SMTP_PORT)
-            server.starttls()
-            server.login(BREVO_SMTP_USERNAME, BREVO_SMTP_PASSWORD)
-            server.send_message(msg)
-            server.quit()
-            print("Message",msg)
+    await db.commit()
+    notification_dispatcher.wake()
+    print("otp saved and queued for delivery------", user.id)
 
-        else:
-            sms.send(message=f"Your OTP is {otp_code}", recipients=[user.phone])
+    return {"message": "OTP sent", "user_id": user.id}
 
-        return {"message": "OTP sent", "user_id": user.id}
+# ---------------- VERIFY OTP ----------------
+@router.post("/verify-code/{user_id}", tags=["auth"])
+async def verify_otp(user_id: int, data: VerifyOTPRequest, db: AsyncSession = Depends(get_async_db)):
+    result = await otp_store.verify(db, user_id, data.otp)
 
+    if result == OTP_EXPIRED:
+        raise HTTPException(status_code=400, detail="OTP expired")
+    if result == OTP_LOCKED:
+        raise HTTPException(status_code=429, detail="Too many attempts, request a new OTP")
+    if result != OTP_VALID:
+        raise HTTPException(status_code=400, detail="Invalid OTP")
 
-    finally:
-        db.close()
+    return {"message": "OTP verified"}
 
 # ---------------- RESET PASSWORD ----------------
 @router.post("/reset-password/{user_id}", tags=["auth"])
-def reset_password(user_id: int, data: ResetPasswordRequest):
-    user = db.query(User).filter(User.id == user_id).first()
+async def reset_password(user_id: int, data: ResetPasswordRequest, db: AsyncSession = Depends(get_async_db)):
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    user.password = hash_password(data.new_password)
+    user.password = await hash_password(data.new_password)
     user.updated_at = datetime.utcnow()
-    db.commit()
+    # Sign out every session that used the old password
+    token_revocations.revoke_user(user)
+    await db.commit()
+    invalidate_cached_user(user.email)
 
     return {"message": "Password updated"}
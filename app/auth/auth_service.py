@@ -1,52 +1,81 @@
-from app.models import User, session
-import bcrypt
+from app.models import User, get_async_db
+from app.cache import MemoryCacheBackend
+from app.config import USER_CACHE_TTL_SECONDS, USER_CACHE_MAX_ENTRIES
 from .jwt_handler import JWTHandler
+from .passwords import password_service, PasswordServiceBusy
 from datetime import timedelta
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-db = session()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 jwt_handler = JWTHandler()
 
-# Hash password
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+# Authenticated users keyed by token subject (email).
+# Entries are detached from their session so they can be shared across requests.
+user_cache = MemoryCacheBackend(max_entries=USER_CACHE_MAX_ENTRIES)
+
+def invalidate_cached_user(email: str):
+    user_cache.delete_prefix(email + ":")
+
+# Hash password (bcrypt runs in the password service pool)
+async def hash_password(password: str) -> str:
+    try:
+        return await password_service.hash(password)
+    except PasswordServiceBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
 
 # Verify password
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+async def verify_password(password: str, hashed: str) -> bool:
+    try:
+        return await password_service.verify(password, hashed)
+    except PasswordServiceBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+async def find_user_by_email(db: AsyncSession, email: str):
+    result = await db.execute(select(User).where(User.email == email))
+    return result.scalar_one_or_none()
 
-def register_user(full_name: str, email: str, password: str):
+async def save_user(db: AsyncSession, user: User):
+    db.add(user)
+    await db.commit()
+    await db.refresh(user)
+
+async def register_user(db: AsyncSession, full_name: str, email: str, password: str):
     print("----------",full_name)
     # Check if user already exists
-    existing_user = db.query(User).filter(User.email == email).first()
+    existing_user = await find_user_by_email(db, email)
     if existing_user:
         raise ValueError("Email already registered")
 
     # Hash password
-    hashed = hash_password(password)
+    hashed = await hash_password(password)
 
     # Create user
     new_user = User(full_name=full_name, email=email, password=hashed)
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await save_user(db, new_user)
+    invalidate_cached_user(email)
     return new_user
 
-# Authenticate user
-def authenticate_user(email: str, password: str):
-    user = db.query(User).filter(User.email == email).first()
-    if user and verify_password(password, user.password):
-        return user
-    return None
+# Authenticate user, upgrading the stored hash when the bcrypt cost has changed
+async def authenticate_user(db: AsyncSession, email: str, password: str):
+    user = await find_user_by_email(db, email)
+    if not user or not await verify_password(password, user.password):
+        return None
 
-# Create access token
-def create_access_token(email: str, expires_minutes: int = 60):
-    return jwt_handler.create_token(email=email, expires_delta=timedelta(minutes=expires_minutes))
+    if password_service.needs_rehash(user.password):
+        user.password = await hash_password(password)
+        await save_user(db, user)
+    return user
+
+# Create access token; it lives ACCESS_TOKEN_EXPIRE_MINUTES unless told otherwise
+def create_access_token(email: str, expires_minutes: int = None, user_id: int = None):
+    expires_delta = timedelta(minutes=expires_minutes) if expires_minutes else None
+    return jwt_handler.create_token(email=email, expires_delta=expires_delta, user_id=user_id)
 
 # Get current user dependency
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     payload = jwt_handler.decode_token(token)
     if not payload:
         raise HTTPException(
@@ -54,13 +83,29 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
             detail="Invalid token",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    user = db.query(User).filter(User.email == payload.get("sub")).first()
+    email = payload.get("sub")
+    key = f"{email}:"
+    user = user_cache.get(key)
+    if user is not None:
+        return user
+
+    # Tokens carrying the user id resolve with a primary-key lookup
+    user_id = payload.get("uid")
+    if user_id is not None:
+        user = await db.get(User, user_id)
+        if user and user.email != email:
+            user = None
+    else:
+        user = await find_user_by_email(db, email)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+    db.expunge(user)
+    user_cache.set(key, user, USER_CACHE_TTL_SECONDS)
     return user
 
 async def get_current_active_user(current_user: User = Depends(get_current_user)):
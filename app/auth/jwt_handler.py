@@ -1,11 +1,26 @@
 from datetime import datetime, timedelta
+import hashlib
+import time
+import uuid
 import jwt
-from app.config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.cache import MemoryCacheBackend
+from app.config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, TOKEN_CACHE_MAX_ENTRIES
+from .revocation import token_revocations
 
 ACCESS_TOKEN_EXPIRE_MINUTES = int(ACCESS_TOKEN_EXPIRE_MINUTES)
 class JWTHandler:
 
-    def create_token(self, email: str, expires_delta: timedelta = None):
+    # The prepared key, algorithm list and decoder are built once, not per token.
+    # Verified payloads are remembered by token digest until the token expires,
+    # so repeat requests skip the signature check; revocation is checked every time.
+    def __init__(self, revocations=token_revocations, cache_size: int = TOKEN_CACHE_MAX_ENTRIES):
+        self.key = jwt.get_algorithm_by_name(ALGORITHM).prepare_key(SECRET_KEY)
+        self.algorithms = [ALGORITHM]
+        self.decoder = jwt.PyJWT(options={"require": ["exp", "sub"]})
+        self.verified = MemoryCacheBackend(max_entries=cache_size)
+        self.revocations = revocations
+
+    def create_token(self, email: str, expires_delta: timedelta = None, user_id: int = None):
         if expires_delta:
             expire = datetime.utcnow() + expires_delta
         else:
@@ -13,14 +28,27 @@ class JWTHandler:
         payload = {
             "sub": email,
             "exp": expire,
-            "iat": datetime.utcnow()
+            # Sub-second so a token issued right after a password reset is not caught by it
+            "iat": time.time(),
+            "jti": uuid.uuid4().hex,
         }
-        token = jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+        if user_id is not None:
+            payload["uid"] = user_id
+        token = jwt.encode(payload, self.key, algorithm=ALGORITHM)
         return token
 
     def decode_token(self, token: str):
-        try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            return payload
-        except:
+        key = hashlib.blake2b(token.encode(), digest_size=16).hexdigest()
+        payload = self.verified.get(key)
+        if payload is None:
+            try:
+                payload = self.decoder.decode(token, self.key, algorithms=self.algorithms)
+            except jwt.PyJWTError:
+                return None
+            ttl = payload["exp"] - time.time()
+            if ttl > 0:
+                self.verified.set(key, payload, ttl)
+
+        if self.revocations.is_revoked(payload):
             return None
+        return payload
@@ -0,0 +1,142 @@
+import asyncio
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import OTP, async_session
+from app.config import SECRET_KEY, OTP_STORE, OTP_TTL_MINUTES, OTP_MAX_ATTEMPTS, OTP_PURGE_INTERVAL_SECONDS
+
+# Verification outcomes
+OTP_VALID = "valid"
+OTP_INVALID = "invalid"
+OTP_EXPIRED = "expired"
+OTP_LOCKED = "locked"
+
+def generate_otp() -> str:
+    return str(1000 + secrets.randbelow(9000))
+
+# Codes are never stored in clear; the user id is mixed in so equal codes differ per user
+def hash_otp(user_id: int, code: str) -> str:
+    return hmac.new(SECRET_KEY.encode(), f"{user_id}:{code}".encode(), hashlib.sha256).hexdigest()
+
+# Stores keep one active code per user, so issuing replaces any previous code
+# and verifying is a single keyed lookup.
+class DatabaseOTPStore:
+    # Runs in the caller's transaction
+    async def issue(self, db: AsyncSession, user_id: int) -> str:
+        code = generate_otp()
+        dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+        values = {
+            "otp_hash": hash_otp(user_id, code),
+            "attempts": 0,
+            "expires_at": datetime.utcnow() + timedelta(minutes=OTP_TTL_MINUTES),
+            "created_at": datetime.utcnow(),
+        }
+        stmt = dialect.insert(OTP).values(user_id=user_id, **values)
+        await db.execute(stmt.on_conflict_do_update(index_elements=[OTP.user_id], set_=values))
+        return code
+
+    async def verify(self, db: AsyncSession, user_id: int, code: str) -> str:
+        result = await db.execute(select(OTP).where(OTP.user_id == user_id).with_for_update())
+        record = result.scalar_one_or_none()
+        if not record:
+            await db.rollback()
+            return OTP_INVALID
+
+        if record.expires_at <= datetime.utcnow():
+            await db.delete(record)
+            await db.commit()
+            return OTP_EXPIRED
+
+        if record.attempts >= OTP_MAX_ATTEMPTS:
+            await db.rollback()
+            return OTP_LOCKED
+
+        if hmac.compare_digest(record.otp_hash, hash_otp(user_id, code)):
+            await db.delete(record)
+            await db.commit()
+            return OTP_VALID
+
+        record.attempts += 1
+        await db.commit()
+        return OTP_INVALID
+
+    async def purge(self) -> int:
+        async with async_session() as db:
+            result = await db.execute(delete(OTP).where(OTP.expires_at <= datetime.utcnow()))
+            await db.commit()
+            return result.rowcount
+
+# Process-local store for single-worker deployments; codes vanish on restart
+class MemoryOTPStore:
+    def __init__(self):
+        self.codes = {}
+        self.lock = threading.Lock()
+
+    async def issue(self, db: AsyncSession, user_id: int) -> str:
+        code = generate_otp()
+        with self.lock:
+            self.codes[user_id] = [hash_otp(user_id, code), 0, time.monotonic() + OTP_TTL_MINUTES * 60]
+        return code
+
+    async def verify(self, db: AsyncSession, user_id: int, code: str) -> str:
+        with self.lock:
+            record = self.codes.get(user_id)
+            if not record:
+                return OTP_INVALID
+
+            otp_hash, attempts, expires_at = record
+            if expires_at <= time.monotonic():
+                del self.codes[user_id]
+                return OTP_EXPIRED
+            if attempts >= OTP_MAX_ATTEMPTS:
+                return OTP_LOCKED
+            if hmac.compare_digest(otp_hash, hash_otp(user_id, code)):
+                del self.codes[user_id]
+                return OTP_VALID
+
+            record[1] += 1
+            return OTP_INVALID
+
+    async def purge(self) -> int:
+        now = time.monotonic()
+        with self.lock:
+            expired = [user_id for user_id, record in self.codes.items() if record[2] <= now]
+            for user_id in expired:
+                del self.codes[user_id]
+        return len(expired)
+
+otp_store = MemoryOTPStore() if OTP_STORE == "memory" else DatabaseOTPStore()
+
+# Periodically drop expired codes so the store only holds live ones
+class OTPPurger:
+    def __init__(self, interval: float = OTP_PURGE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.worker = None
+
+    async def start(self):
+        self.worker = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker = None
+
+    async def run(self):
+        while True:
+            try:
+                purged = await otp_store.purge()
+                if purged:
+                    print("Expired OTPs purged:", purged)
+            except Exception as e:
+                print("Error purging OTPs:", e)
+            await asyncio.sleep(self.interval)
+
+otp_purger = OTPPurger()
@@ -0,0 +1,70 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+from app.config import BCRYPT_ROUNDS, PASSWORD_WORKERS, PASSWORD_MAX_PENDING
+
+class PasswordServiceBusy(Exception):
+    pass
+
+# bcrypt runs in its own small thread pool (it releases the GIL), so a burst of
+# logins is bounded by PASSWORD_WORKERS cores and cannot exhaust the threadpool
+# or event loop that serves the rest of the API. Work beyond PASSWORD_MAX_PENDING
+# queued calls is rejected instead of piling up.
+class PasswordService:
+    def __init__(self, rounds: int = BCRYPT_ROUNDS, workers: int = PASSWORD_WORKERS, max_pending: int = PASSWORD_MAX_PENDING):
+        self.rounds = rounds
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+
+    async def run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordServiceBusy("Too many password operations in progress")
+
+        self.pending += 1
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+            self.total_seconds += time.perf_counter() - started
+
+    # Hash password
+    async def hash(self, password: str) -> str:
+        def work():
+            return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=self.rounds)).decode('utf-8')
+        return await self.run(work)
+
+    # Verify password
+    async def verify(self, password: str, hashed: str) -> bool:
+        def work():
+            return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+        return await self.run(work)
+
+    # Hashes look like $2b$12$...; rehash when the stored cost differs from the configured one
+    def needs_rehash(self, hashed: str) -> bool:
+        try:
+            return int(hashed.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def stats(self):
+        return {
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "total_seconds": self.total_seconds,
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+password_service = PasswordService()
@@ -0,0 +1,114 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import RevokedToken, User, async_session
+from app.config import TOKEN_REVOCATION_REFRESH_SECONDS, ACCESS_TOKEN_EXPIRE_MINUTES
+
+def to_timestamp(value: datetime) -> float:
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+# Merge per-user cutoffs into `users`, keeping the later one
+def merge_users(users: dict, other: dict):
+    for email, cutoff in other.items():
+        users[email] = max(users.get(email, 0), cutoff)
+
+# Revoked access tokens, held in memory so checking a token never touches the database.
+# Two kinds of revocation:
+#   - one token, by its jti (logout), stored in revoked_tokens until it expires
+#   - every token of a user issued before a time (password reset), users.tokens_revoked_at
+# Revocations made by this process apply immediately; those made by other
+# workers are picked up on the next refresh.
+class TokenRevocations:
+    def __init__(self, interval: float = TOKEN_REVOCATION_REFRESH_SECONDS):
+        self.interval = interval
+        self.tokens = set()
+        self.users = {}
+        # Revocations made since the previous refresh began, which it may
+        # have read before their transactions committed
+        self.recent_tokens = set()
+        self.recent_users = {}
+        self.worker = None
+
+    def is_revoked(self, payload: dict) -> bool:
+        jti = payload.get("jti")
+        if jti is not None and jti in self.tokens:
+            return True
+        cutoff = self.users.get(payload.get("sub"))
+        return cutoff is not None and payload.get("iat", 0) <= cutoff
+
+    # Runs in the caller's transaction. Tokens without a jti (issued before
+    # revocation existed) can only be revoked together with the rest of the user's.
+    async def revoke_token(self, db: AsyncSession, payload: dict):
+        jti = payload.get("jti")
+        if jti is None:
+            user = (await db.execute(select(User).where(User.email == payload.get("sub")))).scalar_one_or_none()
+            if user:
+                self.revoke_user(user)
+            return
+
+        dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+        stmt = dialect.insert(RevokedToken).values(
+            jti=jti,
+            expires_at=datetime.fromtimestamp(payload["exp"], timezone.utc).replace(tzinfo=None),
+            created_at=datetime.utcnow(),
+        )
+        await db.execute(stmt.on_conflict_do_nothing(index_elements=[RevokedToken.jti]))
+        self.tokens.add(jti)
+        self.recent_tokens.add(jti)
+
+    # Marks the user for the caller to commit
+    def revoke_user(self, user: User):
+        user.tokens_revoked_at = datetime.utcnow()
+        self.users[user.email] = self.recent_users[user.email] = to_timestamp(user.tokens_revoked_at)
+
+    # Reload both lists and drop revocations of tokens that have expired anyway.
+    # A user revoked longer ago than a token lives has no token left to reject.
+    async def refresh(self):
+        now = datetime.utcnow()
+        oldest = now - timedelta(minutes=int(ACCESS_TOKEN_EXPIRE_MINUTES))
+        # Revocations recorded since the previous refresh began are merged into
+        # what this one reads, as their transactions may not have committed yet
+        previous_tokens, previous_users = self.recent_tokens, self.recent_users
+        self.recent_tokens, self.recent_users = set(), {}
+        try:
+            async with async_session() as db:
+                await db.execute(delete(RevokedToken).where(RevokedToken.expires_at <= now))
+                await db.commit()
+                tokens = set((await db.scalars(select(RevokedToken.jti))).all())
+                users = {
+                    email: to_timestamp(revoked_at)
+                    for email, revoked_at in await db.execute(
+                        select(User.email, User.tokens_revoked_at).where(User.tokens_revoked_at > oldest)
+                    )
+                }
+        except Exception:
+            # Still unconfirmed; the next refresh merges them
+            self.recent_tokens |= previous_tokens
+            merge_users(self.recent_users, previous_users)
+            raise
+        tokens |= previous_tokens | self.recent_tokens
+        merge_users(users, previous_users)
+        merge_users(users, self.recent_users)
+        self.tokens, self.users = tokens, users
+
+    async def start(self):
+        self.worker = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker = None
+
+    async def run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print("Error refreshing token revocations:", e)
+            await asyncio.sleep(self.interval)
+
+token_revocations = TokenRevocations()
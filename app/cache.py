@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import OrderedDict
+
+from app.config import CACHE_ENABLED, CACHE_TTL_SECONDS, CACHE_MAX_ENTRIES
+
+# Storage interface. A shared store (e.g. Redis) can implement these four
+# methods and be passed to ReadCache instead of the in-process default.
+class CacheBackend:
+    def get(self, key: str):
+        raise NotImplementedError
+
+    def set(self, key: str, value, ttl: float):
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix: str):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+# In-process LRU with per-entry expiry
+class MemoryCacheBackend(CacheBackend):
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: float):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete_prefix(self, prefix: str):
+        with self.lock:
+            for key in [k for k in self.entries if k.startswith(prefix)]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+# Read-through cache keyed by namespace (endpoint) and parameters,
+# with hit/miss counters per namespace. Each namespace has a generation that
+# invalidate() bumps, so a load that started before an invalidation does not
+# store its (possibly stale) result.
+class ReadCache:
+    def __init__(self, backend: CacheBackend, ttl: float = CACHE_TTL_SECONDS, enabled: bool = CACHE_ENABLED):
+        self.backend = backend
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = {}
+        self.misses = {}
+        self.generations = {}
+        self.lock = threading.Lock()
+
+    def make_key(self, namespace: str, params: tuple):
+        return namespace + ":" + ":".join(str(p) for p in params)
+
+    # `loader` is an async callable, awaited only on a miss
+    async def get_or_set(self, namespace: str, params: tuple, loader):
+        if not self.enabled:
+            return await loader()
+
+        key = self.make_key(namespace, params)
+        value = self.backend.get(key)
+        if value is not None:
+            with self.lock:
+                self.hits[namespace] = self.hits.get(namespace, 0) + 1
+            return value
+
+        with self.lock:
+            self.misses[namespace] = self.misses.get(namespace, 0) + 1
+            generation = self.generations.get(namespace, 0)
+        value = await loader()
+        with self.lock:
+            if self.generations.get(namespace, 0) == generation:
+                self.backend.set(key, value, self.ttl)
+        return value
+
+    def invalidate(self, *namespaces: str):
+        for namespace in namespaces:
+            with self.lock:
+                self.generations[namespace] = self.generations.get(namespace, 0) + 1
+            self.backend.delete_prefix(namespace + ":")
+
+    def stats(self):
+        return {
+            namespace: {"hits": self.hits.get(namespace, 0), "misses": self.misses.get(namespace, 0)}
+            for namespace in sorted(set(self.hits) | set(self.misses))
+        }
+
+cache = ReadCache(MemoryCacheBackend())
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+from sqlalchemy import select, update
+
+from app.models import Payment, async_session
+from app.payment_status import payment_events
+from app.config import (
+    CALLBACK_QUEUE_SIZE, CALLBACK_BATCH_SIZE, CALLBACK_BATCH_WAIT_MS,
+    CALLBACK_RETRY_BASE_SECONDS, CALLBACK_RETRY_MAX_SECONDS, CALLBACK_DRAIN_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Pull what we need out of a Daraja stkCallback payload.
+# Returns None for payloads that are not STK callbacks.
+def parse_callback(data: dict):
+    stk_callback = (data or {}).get("Body", {}).get("stkCallback")
+    if not stk_callback or not stk_callback.get("CheckoutRequestID"):
+        return None
+
+    if stk_callback.get("ResultCode") == 0:
+        items = stk_callback.get("CallbackMetadata", {}).get("Item", [])
+        amount = next((i.get("Value") for i in items if i.get("Name") == "Amount"), None)
+        trans_code = next((i.get("Value") for i in items if i.get("Name") in ["MpesaReceiptNumber", "ReceiptNumber"]), None)
+        amount = float(amount) if amount else 0
+        trans_code = trans_code or "N/A"
+    else:
+        amount = 0
+        trans_code = "FAILED"
+
+    return {
+        "mrid": stk_callback.get("MerchantRequestID"),
+        "crid": stk_callback.get("CheckoutRequestID"),
+        "amount": amount,
+        "trans_code": trans_code,
+    }
+
+# Failure update for an STK push query that reports a non-zero ResultCode.
+# Returns None while Daraja is still processing or the push succeeded, in which
+# case the callback remains the source of the amount and receipt number.
+def parse_query_failure(crid: str, res: dict):
+    result_code = res.get("ResultCode")
+    if result_code is None or str(result_code) == "0":
+        return None
+    return {"mrid": res.get("MerchantRequestID"), "crid": crid, "amount": 0, "trans_code": "FAILED"}
+
+# Final update for an STK push query, used once the callback is overdue.
+# A successful query carries no receipt number or amount, so the payment is
+# completed with the amount requested in the push and receipt "N/A"; the
+# receipt is filled in if the callback turns up after all.
+# Returns None when Daraja has no final result yet (or the query errored).
+def parse_query_result(crid: str, res: dict, requested_amount: float = None):
+    if str(res.get("ResultCode")) == "0":
+        return {"mrid": res.get("MerchantRequestID"), "crid": crid, "amount": requested_amount or 0, "trans_code": "N/A"}
+    return parse_query_failure(crid, res)
+
+# An update that carries an M-Pesa receipt number
+def has_receipt(update: dict) -> bool:
+    return update["trans_code"] not in ("N/A", "FAILED")
+
+# Apply a batch of parsed callbacks in one transaction.
+# Only PENDING payments are touched, so Safaricom's retries are no-ops, except
+# that a completion without a receipt ("N/A") takes one from a later callback.
+# Failures stay final. Returns the updates that were applied, with their sale_id.
+async def apply_callbacks(updates: list):
+    by_crid = {}
+    for u in updates:
+        by_crid.setdefault(u["crid"], u)
+
+    async with async_session() as db:
+        result = await db.execute(
+            select(Payment.id, Payment.crid, Payment.sale_id, Payment.trans_code).where(
+                Payment.crid.in_(list(by_crid)),
+                Payment.trans_code.in_(["PENDING", "N/A"]),
+            )
+        )
+        pending = [p for p in result.all() if p.trans_code == "PENDING" or has_receipt(by_crid[p.crid])]
+        if not pending:
+            return []
+
+        rows = [
+            {"id": p.id, "amount": by_crid[p.crid]["amount"], "trans_code": by_crid[p.crid]["trans_code"]}
+            for p in pending
+        ]
+        await db.execute(update(Payment), rows)
+        await db.commit()
+        return [dict(by_crid[p.crid], sale_id=p.sale_id) for p in pending]
+
+# Acknowledge-now, apply-later ingestion of M-Pesa callbacks.
+# A single worker drains the queue in batches of up to CALLBACK_BATCH_SIZE,
+# waiting at most CALLBACK_BATCH_WAIT_MS for a batch to fill. Safaricom has
+# already been acknowledged, so a batch that fails to apply (the database is
+# down, say) is retried until it succeeds rather than dropped; meanwhile new
+# callbacks queue up, and once the queue is full they are applied inline and
+# fail back to Safaricom, which resends them.
+class CallbackIngestor:
+    def __init__(
+        self,
+        queue_size: int = CALLBACK_QUEUE_SIZE,
+        batch_size: int = CALLBACK_BATCH_SIZE,
+        batch_wait_ms: int = CALLBACK_BATCH_WAIT_MS,
+        retry_base: float = CALLBACK_RETRY_BASE_SECONDS,
+        retry_max: float = CALLBACK_RETRY_MAX_SECONDS,
+        drain_timeout: float = CALLBACK_DRAIN_SECONDS,
+    ):
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.drain_timeout = drain_timeout
+        self.queue = None
+        self.worker = None
+        self.current = []
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.worker = asyncio.create_task(self.run())
+
+    # Waits for queued callbacks to be applied; any still held after
+    # drain_timeout are logged so they can be reconciled by hand
+    async def stop(self):
+        if self.worker is None:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            held = self.current + [self.queue.get_nowait() for _ in range(self.queue.qsize())]
+            logger.error("Stopping with %d callbacks not applied: %s", len(held), ", ".join(u["crid"] for u in held))
+        self.worker.cancel()
+        self.worker = None
+        self.queue = None
+
+    # Enqueue a parsed callback. When the queue is full (or the worker is not
+    # running) the update is applied inline so nothing is dropped.
+    async def submit(self, update: dict):
+        if self.queue is not None:
+            try:
+                self.queue.put_nowait(update)
+                return
+            except asyncio.QueueFull:
+                pass
+        await self.apply([update])
+
+    # Apply a batch and wake anyone waiting on those sales
+    async def apply(self, batch: list):
+        applied = await apply_callbacks(batch)
+        for u in applied:
+            payment_events.publish(u["sale_id"], {"trans_code": u["trans_code"], "amount": u["amount"]})
+        return applied
+
+    async def next_batch(self):
+        batch = [await self.queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.batch_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def apply_with_retry(self, batch: list):
+        delay = self.retry_base
+        attempt = 1
+        while True:
+            try:
+                return await self.apply(batch)
+            except Exception:
+                logger.exception("Applying %d callbacks failed (attempt %d), retrying in %.1fs", len(batch), attempt, delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.retry_max)
+            attempt += 1
+
+    async def run(self):
+        while True:
+            batch = self.current = await self.next_batch()
+            try:
+                applied = await self.apply_with_retry(batch)
+                logger.info("Callbacks applied: %d of %d received", len(applied), len(batch))
+            finally:
+                self.current = []
+                for _ in batch:
+                    self.queue.task_done()
+
+callback_ingestor = CallbackIngestor()
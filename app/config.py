@@ -4,6 +4,24 @@ from dotenv import load_dotenv
 load_dotenv()
 
 DB_URL = os.getenv("DATABASE_URL")
+
+# Async driver URL for the same database (asyncpg for Postgres, aiosqlite for SQLite)
+def to_async_url(url):
+    if not url:
+        return url
+    scheme, rest = url.split(":", 1)
+    if scheme.startswith("postgres"):
+        return "postgresql+asyncpg:" + rest
+    if scheme.startswith("sqlite"):
+        return "sqlite+aiosqlite:" + rest
+    return url
+
+ASYNC_DB_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DB_URL)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES")
@@ -15,4 +33,94 @@ BREVO_SMTP_PORT = os.getenv("BREVO_SMTP_PORT")
 SMTP_FROM_EMAIL = os.getenv("SMTP_FROM_EMAIL")
 
 AT_USERNAME = os.getenv("AT_USERNAME")
-AT_API_KEY = os.getenv("AT_API_KEY")
\ No newline at end of file
+AT_API_KEY = os.getenv("AT_API_KEY")
+
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "30"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+
+MPESA_BASE_URL = os.getenv("MPESA_BASE_URL", "https://sandbox.safaricom.co.ke")
+MPESA_TIMEOUT_SECONDS = float(os.getenv("MPESA_TIMEOUT_SECONDS", "10"))
+MPESA_MAX_RETRIES = int(os.getenv("MPESA_MAX_RETRIES", "2"))
+MPESA_MAX_CONNECTIONS = int(os.getenv("MPESA_MAX_CONNECTIONS", "20"))
+
+CALLBACK_QUEUE_SIZE = int(os.getenv("CALLBACK_QUEUE_SIZE", "10000"))
+CALLBACK_BATCH_SIZE = int(os.getenv("CALLBACK_BATCH_SIZE", "500"))
+CALLBACK_BATCH_WAIT_MS = int(os.getenv("CALLBACK_BATCH_WAIT_MS", "50"))
+# A batch that fails to apply is retried with backoff between these bounds;
+# on shutdown the worker waits up to CALLBACK_DRAIN_SECONDS for the queue to empty
+CALLBACK_RETRY_BASE_SECONDS = float(os.getenv("CALLBACK_RETRY_BASE_SECONDS", "1"))
+CALLBACK_RETRY_MAX_SECONDS = float(os.getenv("CALLBACK_RETRY_MAX_SECONDS", "30"))
+CALLBACK_DRAIN_SECONDS = float(os.getenv("CALLBACK_DRAIN_SECONDS", "30"))
+
+PAYMENT_STATUS_TIMEOUT = float(os.getenv("PAYMENT_STATUS_TIMEOUT", "30"))
+
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "1024"))
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", "2"))
+PASSWORD_MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", "64"))
+
+NOTIFY_POLL_SECONDS = float(os.getenv("NOTIFY_POLL_SECONDS", "5"))
+NOTIFY_BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", "100"))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5"))
+NOTIFY_RETRY_BASE_SECONDS = float(os.getenv("NOTIFY_RETRY_BASE_SECONDS", "10"))
+# How long a dispatcher holds claimed messages before another may retry them
+NOTIFY_CLAIM_SECONDS = float(os.getenv("NOTIFY_CLAIM_SECONDS", "300"))
+
+OTP_STORE = os.getenv("OTP_STORE", "db")  # db | memory
+OTP_TTL_MINUTES = int(os.getenv("OTP_TTL_MINUTES", "10"))
+OTP_MAX_ATTEMPTS = int(os.getenv("OTP_MAX_ATTEMPTS", "5"))
+OTP_PURGE_INTERVAL_SECONDS = float(os.getenv("OTP_PURGE_INTERVAL_SECONDS", "300"))
+
+SALES_BATCH_MAX = int(os.getenv("SALES_BATCH_MAX", "500"))
+
+# Metrics: Prometheus text on /metrics and Server-Timing headers. When disabled
+# no middleware or engine hooks are installed.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() == "true"
+
+# Access tokens: verified-token cache size and how often revocations are reloaded
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "4096"))
+TOKEN_REVOCATION_REFRESH_SECONDS = float(os.getenv("TOKEN_REVOCATION_REFRESH_SECONDS", "30"))
+
+# Reconciliation of payments whose M-Pesa callback never arrived
+RECONCILE_ENABLED = os.getenv("RECONCILE_ENABLED", "true").lower() == "true"
+RECONCILE_INTERVAL_SECONDS = float(os.getenv("RECONCILE_INTERVAL_SECONDS", "60"))
+RECONCILE_AFTER_SECONDS = float(os.getenv("RECONCILE_AFTER_SECONDS", "120"))
+RECONCILE_MAX_AGE_HOURS = float(os.getenv("RECONCILE_MAX_AGE_HOURS", "24"))
+RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", "500"))
+RECONCILE_CONCURRENCY = int(os.getenv("RECONCILE_CONCURRENCY", "20"))
+RECONCILE_RATE_PER_SECOND = float(os.getenv("RECONCILE_RATE_PER_SECOND", "50"))
+
+# Outbound providers (app/resilience.py): calls per second and burst (0 = no
+# limit), calls in flight, a deadline per call including the wait for a slot,
+# and a circuit breaker that fails fast for CIRCUIT_RESET_SECONDS after
+# CIRCUIT_FAILURE_THRESHOLD consecutive failures.
+MPESA_RATE_PER_SECOND = float(os.getenv("MPESA_RATE_PER_SECOND", "100"))
+MPESA_BURST = int(os.getenv("MPESA_BURST", "200"))
+MPESA_CONCURRENCY = int(os.getenv("MPESA_CONCURRENCY", str(MPESA_MAX_CONNECTIONS)))
+MPESA_CALL_TIMEOUT_SECONDS = float(os.getenv("MPESA_CALL_TIMEOUT_SECONDS", "15"))
+SMS_RATE_PER_SECOND = float(os.getenv("SMS_RATE_PER_SECOND", "10"))
+SMS_BURST = int(os.getenv("SMS_BURST", "20"))
+SMS_CONCURRENCY = int(os.getenv("SMS_CONCURRENCY", "4"))
+SMS_TIMEOUT_SECONDS = float(os.getenv("SMS_TIMEOUT_SECONDS", "10"))
+SMTP_RATE_PER_SECOND = float(os.getenv("SMTP_RATE_PER_SECOND", "10"))
+SMTP_BURST = int(os.getenv("SMTP_BURST", "20"))
+SMTP_CONCURRENCY = int(os.getenv("SMTP_CONCURRENCY", "2"))
+SMTP_TIMEOUT_SECONDS = float(os.getenv("SMTP_TIMEOUT_SECONDS", "30"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+# Inbound rate limits on the expensive endpoints (app/ratelimit.py): login and
+# token share a per-IP budget, forgot-password is per IP, STK push per user.
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+RATE_LIMIT_LOGIN_PER_MINUTE = int(os.getenv("RATE_LIMIT_LOGIN_PER_MINUTE", "20"))
+RATE_LIMIT_FORGOT_PASSWORD_PER_HOUR = int(os.getenv("RATE_LIMIT_FORGOT_PASSWORD_PER_HOUR", "10"))
+RATE_LIMIT_STKPUSH_PER_MINUTE = int(os.getenv("RATE_LIMIT_STKPUSH_PER_MINUTE", "30"))
+
+# Fast JSON mode: orjson as the default response class, and list endpoints
+# encode their SQL rows directly instead of building and re-validating models
+FAST_JSON_ENABLED = os.getenv("FAST_JSON_ENABLED", "false").lower() == "true"
\ No newline at end of file
@@ -0,0 +1,47 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+from app.models import async_session
+
+EXPORT_BATCH_SIZE = 1000
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+def encode_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+# Stream the rows of a select() as NDJSON or CSV chunks.
+# The generator owns its session because it keeps running after the request
+# dependencies have been torn down; rows are fetched through a server-side
+# cursor EXPORT_BATCH_SIZE at a time so memory stays flat for any table size.
+async def stream_export(stmt, columns, fmt: str):
+    async with async_session() as db:
+        result = await db.stream(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if fmt == "csv" else None
+
+        if writer:
+            writer.writerow(columns)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+        async for partition in result.partitions():
+            for row in partition:
+                values = [encode_value(getattr(row, c)) for c in columns]
+                if writer:
+                    writer.writerow(values)
+                else:
+                    buffer.write(json.dumps(dict(zip(columns, values))))
+                    buffer.write("\n")
+
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
@@ -1,27 +1,67 @@
-from typing import List
-from fastapi import FastAPI, Depends, HTTPException
-from fastapi.responses import JSONResponse
+from typing import List, Literal, Optional
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import text
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from contextlib import asynccontextmanager
 from datetime import datetime
-import json
+import asyncio
+import logging
+import math
 
-from app.models import Product, Sale, User, Payment, session
+from app.models import Product, Sale, SalesDetails, User, Payment, get_async_db
 from app.auth.auth_service import get_current_user
 from app.auth.auth_routes import router as auth_router
-from app.mpesa import send_stk_push  
-
-from pydantic import BaseModel
-
-app = FastAPI()
-db = session()
-try:
-    db.execute("SELECT 1")  
-except:
-    db.rollback()
-    db.close()
-    db = session()  
+from app.auth.passwords import password_service
+from app.auth.otp_service import otp_purger
+from app.auth.revocation import token_revocations
+from app.pagination import CursorParams, PageParams, filter_created, paginate
+from app.export import MEDIA_TYPES, stream_export
+from app.rollups import record_sale, record_sales, profit_per_product, sales_per_day
+from app.cache import cache
+from app.product_import import ImportFormatError, import_products, iter_csv, iter_json_array, write_batch
+from app.mpesa import mpesa_client
+from app.callbacks import callback_ingestor, parse_callback, parse_query_failure
+from app.payment_status import payment_events, load_payment
+from app.reconciliation import payment_reconciler
+from app.notifications import notification_dispatcher
+from app.metrics import MetricsMiddleware, metrics_endpoint
+from app.ratelimit import RateLimitMiddleware
+from app.responses import ORJSONResponse, dicts_response, row_dicts, rows_response
+from app.config import (
+    PAYMENT_STATUS_TIMEOUT, SALES_BATCH_MAX, METRICS_ENABLED, SERVER_TIMING_ENABLED, RECONCILE_ENABLED,
+    RATE_LIMIT_ENABLED, FAST_JSON_ENABLED,
+)
 
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+# --- Lifespan: background workers and pooled outbound connections ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await callback_ingestor.start()
+    await notification_dispatcher.start()
+    await otp_purger.start()
+    await token_revocations.start()
+    if RECONCILE_ENABLED:
+        await payment_reconciler.start()
+    yield
+    await payment_reconciler.stop()
+    await token_revocations.stop()
+    await otp_purger.stop()
+    await notification_dispatcher.stop()
+    await callback_ingestor.stop()
+    await mpesa_client.aclose()
+    password_service.shutdown()
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse if FAST_JSON_ENABLED else JSONResponse)
+
+# --- Rate limiting ---
+# Added before CORS so 429 responses still carry the CORS headers
+if RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware)
 
 # --- CORS ---
 origins = ["*"]
@@ -32,8 +72,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing", "Retry-After"],
 )
 
+# --- Metrics ---
+# Added last so it wraps every other middleware and sees the full latency
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware, server_timing=SERVER_TIMING_ENABLED)
+    app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
+
 # --- Include auth routes ---
 app.include_router(auth_router, prefix="/auth", tags=["auth"])
 
@@ -49,7 +96,7 @@ class ProductDataResponse(ProductData):
 class SaleData(BaseModel):
     pid: int
     quantity: int
-    created_at: datetime = datetime.utcnow()
+    created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class SaleDataResponse(SaleData):
     id: int
@@ -57,6 +104,17 @@ class SaleDataResponse(SaleData):
     product_sp: float
     amount: float
 
+class SaleBatchData(BaseModel):
+    sales: List[SaleData] = Field(..., min_length=1, max_length=SALES_BATCH_MAX)
+
+class BasketData(BaseModel):
+    items: List[SaleData] = Field(..., min_length=1, max_length=SALES_BATCH_MAX)
+
+class BasketResponse(BaseModel):
+    sale_id: int
+    total: float
+    lines: List[SaleDataResponse]
+
 class UserData(BaseModel):
     full_name: str
     email: str
@@ -72,10 +130,12 @@ class PaymentData(BaseModel):
     crid: str
     amount: float | None = None
     trans_code: str | None = None
-    created_at: datetime = datetime.utcnow()
+    created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class PaymentDataResponse(PaymentData):
     id: int
+    product_name: str | None = None
+    sale_amount: float | None = None
 
 # --- MPesa Request Body Model ---
 class STKPushRequest(BaseModel):
@@ -90,24 +150,45 @@ def home():
 
 # --- Products ---
 @app.get("/products", response_model=List[ProductDataResponse])
-def get_products(current_user: User = Depends(get_current_user)):
-    return db.query(Product).all()
+async def get_products(
+    response: Response,
+    page: CursorParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    async def load():
+        stmt = select(Product.id, Product.name, Product.buying_price, Product.selling_price)
+        rows = await paginate(db, stmt, Product.id, page, response)
+        if FAST_JSON_ENABLED:
+            products = row_dicts(rows)
+        else:
+            products = [ProductDataResponse.model_validate(p, from_attributes=True) for p in rows]
+        return products, response.headers.get("X-Next-Cursor")
+
+    products, next_cursor = await cache.get_or_set("products", (page.limit, page.after), load)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if FAST_JSON_ENABLED:
+        return dicts_response(products, response)
+    return products
 
 @app.post("/products", response_model=ProductDataResponse)
-def add_product(prod: ProductData, current_user: User = Depends(get_current_user)):
+async def add_product(prod: ProductData, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
     db_prod = Product(**prod.dict())
     db.add(db_prod)
-    db.commit()
-    db.refresh(db_prod)
+    await db.commit()
+    await db.refresh(db_prod)
+    cache.invalidate("products")
     return db_prod
 
 @app.put("/products/{product_id}", response_model=ProductDataResponse)
-def update_product(
+async def update_product(
     product_id: int,
     prod: ProductData,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    db_prod = db.query(Product).filter(Product.id == product_id).first()
+    db_prod = await db.get(Product, product_id)
 
     if not db_prod:
         raise HTTPException(status_code=404, detail="Product not found")
@@ -116,41 +197,97 @@ def update_product(
     db_prod.buying_price = prod.buying_price
     db_prod.selling_price = prod.selling_price
 
-    db.commit()
-    db.refresh(db_prod)
+    await db.commit()
+    await db.refresh(db_prod)
+    cache.invalidate("products", "dashboard")
 
     return db_prod
 
+# Bulk upsert from a streamed CSV (header: id,name,buying_price,selling_price; id optional)
+# or JSON array body, selected by Content-Type. Rows are validated and written in
+# batched transactions; invalid rows are reported instead of failing the import.
+# A malformed upload gets 400 with the error and the report of the batches
+# already written before it.
+@app.post("/products/import")
+async def import_products_route(request: Request, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
+    content_type = request.headers.get("content-type", "")
+    if "csv" in content_type:
+        records = iter_csv(request.stream())
+    elif "json" in content_type:
+        records = iter_json_array(request.stream())
+    else:
+        raise HTTPException(status_code=415, detail="Send text/csv or application/json")
+
+    async def flush(rows):
+        try:
+            await write_batch(db, rows)
+        except Exception:
+            await db.rollback()
+            raise
+
+    try:
+        report = await import_products(records, flush)
+    except ImportFormatError as e:
+        return JSONResponse({"error": str(e), **(e.report or {})}, status_code=400)
+    finally:
+        cache.invalidate("products", "dashboard")
+    return report
+
 # --- Sales ---
-@app.get("/sales", response_model=List[SaleDataResponse])
-def get_sales(current_user: User = Depends(get_current_user)):
-    sales = db.query(Sale).all()
-    response = []
+# Sales joined to their product, with the amount computed in SQL (one round-trip)
+def sales_query():
+    return select(
+        Sale.id,
+        Sale.pid,
+        Sale.quantity,
+        Sale.created_at,
+        Product.name.label("product_name"),
+        Product.selling_price.label("product_sp"),
+        (Sale.quantity * Product.selling_price).label("amount"),
+    ).join(Product, Product.id == Sale.pid)
 
-    for sale in sales:
-        product = db.query(Product).filter(Product.id == sale.pid).first()
-        if not product:
-            continue
-        response.append(SaleDataResponse(
-            id=sale.id,
-            pid=sale.pid,
-            quantity=sale.quantity,
-            created_at=sale.created_at,
-            product_name=product.name,
-            product_sp=product.selling_price,
-            amount=sale.quantity * product.selling_price
-        ))
-    return response
+@app.get("/sales", response_model=List[SaleDataResponse])
+async def get_sales(
+    response: Response,
+    page: PageParams = Depends(),
+    pid: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    stmt = filter_created(sales_query(), Sale.created_at, page.start, page.end)
+    if pid is not None:
+        stmt = stmt.where(Sale.pid == pid)
+    rows = await paginate(db, stmt, Sale.id, page, response)
+    if FAST_JSON_ENABLED:
+        return rows_response(rows, response)
+    return [SaleDataResponse(**row._mapping) for row in rows]
+
+@app.get("/sales/export")
+async def export_sales(
+    fmt: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user)
+):
+    stmt = filter_created(sales_query(), Sale.created_at, start, end).order_by(Sale.id)
+    columns = ["id", "pid", "quantity", "created_at", "product_name", "product_sp", "amount"]
+    return StreamingResponse(
+        stream_export(stmt, columns, fmt),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f"attachment; filename=sales.{fmt}"},
+    )
 
 @app.post("/sales", response_model=SaleDataResponse)
-def add_sale(sale: SaleData, current_user: User = Depends(get_current_user)):
+async def add_sale(sale: SaleData, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
     try:
         db_sale = Sale(pid=sale.pid, quantity=sale.quantity, created_at=sale.created_at)
         db.add(db_sale)
-        db.commit()
-        db.refresh(db_sale)
+        await record_sale(db, sale.pid, sale.quantity, sale.created_at)
+        await db.commit()
+        await db.refresh(db_sale)
+        cache.invalidate("dashboard")
 
-        product = db.query(Product).filter(Product.id == db_sale.pid).first()
+        product = await db.get(Product, db_sale.pid)
         if not product:
             raise HTTPException(status_code=404, detail="Product not found")
 
@@ -164,83 +301,182 @@ def add_sale(sale: SaleData, current_user: User = Depends(get_current_user)):
             amount=db_sale.quantity * product.selling_price
         )
     except Exception as e:
-        db.rollback()
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Insert sale lines in bulk: one query validates every product id, one
+# multi-row INSERT ... RETURNING writes the lines and one upsert updates the rollup.
+# Runs in the caller's transaction.
+async def insert_sales(db: AsyncSession, lines: List[SaleData]):
+    pids = {line.pid for line in lines}
+    result = await db.execute(
+        select(Product.id, Product.name, Product.selling_price).where(Product.id.in_(pids))
+    )
+    products = {p.id: p for p in result}
+    missing = pids - products.keys()
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Products not found: {sorted(missing)}")
+
+    ids = (await db.scalars(
+        insert(Sale).returning(Sale.id, sort_by_parameter_order=True),
+        [{"pid": line.pid, "quantity": line.quantity, "created_at": line.created_at} for line in lines],
+    )).all()
+    await record_sales(db, [(line.pid, line.quantity, line.created_at) for line in lines])
+
+    return [
+        SaleDataResponse(
+            id=sale_id,
+            pid=line.pid,
+            quantity=line.quantity,
+            created_at=line.created_at,
+            product_name=products[line.pid].name,
+            product_sp=products[line.pid].selling_price,
+            amount=line.quantity * products[line.pid].selling_price
+        )
+        for sale_id, line in zip(ids, lines)
+    ]
+
+@app.post("/sales/batch", response_model=List[SaleDataResponse])
+async def add_sales_batch(batch: SaleBatchData, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
+    try:
+        sales = await insert_sales(db, batch.sales)
+        await db.commit()
+        cache.invalidate("dashboard")
+        return sales
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+
+# A basket is several sale lines paid together. Every line is stored as a Sale
+# (so listings and the dashboard see it) and the first line's id is the
+# basket's sale_id, with every line recorded against it in SalesDetails.
+@app.post("/sales/basket", response_model=BasketResponse)
+async def add_basket(basket: BasketData, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
+    try:
+        lines = await insert_sales(db, basket.items)
+        sale_id = lines[0].id
+        await db.execute(
+            insert(SalesDetails),
+            [
+                {"sale_id": sale_id, "product_id": line.pid, "quantity": line.quantity, "created_at": line.created_at}
+                for line in lines
+            ],
+        )
+        await db.commit()
+        cache.invalidate("dashboard")
+        return BasketResponse(sale_id=sale_id, total=sum(line.amount for line in lines), lines=lines)
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        await db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
 
 # --- Dashboard ---
 @app.get("/dashboard")
-def dashboard(current_user: User = Depends(get_current_user)):
-    # Profit per product
-    profit_product = db.execute(text("""
-        SELECT p.name, 
-               SUM((p.selling_price - p.buying_price) * s.quantity) AS profit
-        FROM sales s
-        JOIN products p ON s.pid = p.id
-        GROUP BY p.id
-    """)).fetchall()
-
-    # Sales per day
-    sales_day = db.execute(text("""
-        SELECT DATE(s.created_at) AS date,
-               SUM(p.selling_price * s.quantity) AS sales
-        FROM sales s
-        JOIN products p ON s.pid = p.id
-        GROUP BY date
-        ORDER BY date
-    """)).fetchall()
-
+async def dashboard(db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
     def generate_colors(n):
         return [f"hsl({int(360*i/n)}, 70%, 50%)" for i in range(n)]
 
-    products_name = [row[0] for row in profit_product]
-    products_sales = [float(row[1]) for row in profit_product]
-    products_colour = generate_colors(len(profit_product))
-
-    dates = [row[0].strftime("%Y-%m-%d") for row in sales_day]
-    sales = [float(row[1]) for row in sales_day]
-
-    data = {
-        "profit_per_product": {
-            "products_name": products_name,
-            "products_sales": products_sales,
-            "products_colour": products_colour
-        },
-        "sales_per_day": {
-            "dates": dates,
-            "sales": sales
+    async def build():
+        # Read from the daily rollup instead of scanning every sale
+        profit_product = await profit_per_product(db)
+        sales_day = await sales_per_day(db)
+
+        products_name = [row[0] for row in profit_product]
+        products_sales = [float(row[1]) for row in profit_product]
+        products_colour = generate_colors(len(profit_product))
+
+        dates = [row[0].strftime("%Y-%m-%d") for row in sales_day]
+        sales = [float(row[1]) for row in sales_day]
+
+        return {
+            "profit_per_product": {
+                "products_name": products_name,
+                "products_sales": products_sales,
+                "products_colour": products_colour
+            },
+            "sales_per_day": {
+                "dates": dates,
+                "sales": sales
+            }
         }
-    }
+
+    data = await cache.get_or_set("dashboard", (), build)
     return JSONResponse(content=data)
 
 # --- Users ---
 @app.get("/users", response_model=List[UserDataResponse])
-def get_users(current_user: User = Depends(get_current_user)):
-    return db.query(User).all()
+async def get_users(
+    response: Response,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    stmt = select(User.id, User.full_name, User.email, User.phone, User.password)
+    stmt = filter_created(stmt, User.created_at, page.start, page.end)
+    return await paginate(db, stmt, User.id, page, response)
 
 # --- Payments ---
+# Payments with their sale's product and computed sale amount, in one query
+def payments_query():
+    return select(
+        Payment.id,
+        Payment.sale_id,
+        Payment.mrid,
+        Payment.crid,
+        Payment.amount,
+        Payment.trans_code,
+        Payment.created_at,
+        Product.name.label("product_name"),
+        (Sale.quantity * Product.selling_price).label("sale_amount"),
+    ).outerjoin(Sale, Sale.id == Payment.sale_id).outerjoin(Product, Product.id == Sale.pid)
+
 @app.get("/payments", response_model=List[PaymentDataResponse])
-def get_payments(current_user: User = Depends(get_current_user)):
-    payments = db.query(Payment).all()
-    response = []
-
-    for p in payments:
-        sale = db.query(Sale).filter(Sale.id == p.sale_id).first()
-        product = db.query(Product).filter(Product.id == sale.pid).first() if sale else None
-        response.append(PaymentDataResponse(
-            id=p.id,
-            sale_id=p.sale_id,
-            mrid=p.mrid,
-            crid=p.crid,
-            amount=p.amount,
-            trans_code=p.trans_code,
-            created_at=p.created_at
-        ))
-    return response
+async def get_payments(
+    response: Response,
+    page: PageParams = Depends(),
+    sale_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    stmt = filter_created(payments_query(), Payment.created_at, page.start, page.end)
+    if sale_id is not None:
+        stmt = stmt.where(Payment.sale_id == sale_id)
+    rows = await paginate(db, stmt, Payment.id, page, response)
+    if FAST_JSON_ENABLED:
+        return rows_response(rows, response)
+    return [PaymentDataResponse(**row._mapping) for row in rows]
+
+@app.get("/payments/export")
+async def export_payments(
+    fmt: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user)
+):
+    columns = ["id", "sale_id", "mrid", "crid", "amount", "trans_code", "created_at"]
+    stmt = select(*(getattr(Payment, c) for c in columns))
+    stmt = filter_created(stmt, Payment.created_at, start, end).order_by(Payment.id)
+    return StreamingResponse(
+        stream_export(stmt, columns, fmt),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f"attachment; filename=payments.{fmt}"},
+    )
 
 # --- MPesa STK Push ---
 @app.post("/mpesa/stkpush")
-def mpesa_stk_push(data: STKPushRequest, current_user: User = Depends(get_current_user)):
-    res = send_stk_push(data.amount, data.phone_number, data.sale_id)
+async def mpesa_stk_push(data: STKPushRequest, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
+    res = await mpesa_client.send_stk_push(data.amount, data.phone_number, data.sale_id)
+    if "retry_after" in res:
+        raise HTTPException(
+            status_code=503,
+            detail="M-Pesa is temporarily unavailable",
+            headers={"Retry-After": str(math.ceil(res["retry_after"]))},
+        )
     mrid = res.get("MerchantRequestID")
     crid = res.get("CheckoutRequestID")
 
@@ -253,55 +489,35 @@ def mpesa_stk_push(data: STKPushRequest, current_user: User = Depends(get_curren
         crid=crid,
         amount=0,        # will be updated later in callback
         trans_code="PENDING",
+        requested_amount=int(data.amount),
         created_at=datetime.utcnow()
     )
+
     db.add(payment)
-    db.commit()
-    db.refresh(payment)
+    await db.commit()
+    await db.refresh(payment)
 
     return {"mpesa_response": res, "payment_record_id": payment.id}
 
 # --- MPesa Callback ---
+# Acknowledge immediately; the ingestor applies callbacks in batches
 @app.post("/mpesa/callback")
-def mpesa_callback(data: dict):
-    print("Callback received:", json.dumps(data, indent=2))  # debug print
-    try:
-        stk_callback = data.get("Body", {}).get("stkCallback")
-        if not stk_callback:
-            return {"error": "Invalid callback format"}
-
-        mrid = stk_callback.get("MerchantRequestID")
-        crid = stk_callback.get("CheckoutRequestID")
-        result_code = stk_callback.get("ResultCode")
-
-        payment = db.query(Payment).filter_by(mrid=mrid, crid=crid).first()
-        if not payment:
-            print("Payment record not found for MRID:", mrid, "CRID:", crid)
-            return {"error": "Payment record not found"}
-
-        if result_code == 0:
-            items = stk_callback.get("CallbackMetadata", {}).get("Item", [])
-            amount = next((i.get("Value") for i in items if i.get("Name") == "Amount"), None)
-            trans_code = next((i.get("Value") for i in items if i.get("Name") in ["MpesaReceiptNumber", "ReceiptNumber"]), None)
-
-            payment.amount = float(amount) if amount else 0
-            payment.trans_code = trans_code or "N/A"
-        else:
-            payment.amount = 0
-            payment.trans_code = "FAILED"
-
-        db.commit()
-        print(f"Payment updated: MRID={mrid}, amount={payment.amount}, trans_code={payment.trans_code}")
-        return {"success": True}
+async def mpesa_callback(data: dict):
+    update = parse_callback(data)
+    if not update:
+        return {"error": "Invalid callback format"}
 
-    except Exception as e:
-        print("Error in callback:", e)
-        return {"error": str(e)}
+    logger.debug("Callback received: %s %s", update["crid"], update["trans_code"])
+    await callback_ingestor.submit(update)
+    return {"success": True}
 
 # --- MPesa Checker ---
 @app.get("/mpesa/checker/{sale_id}")
-def mpesa_checker(sale_id: int):
-    payment = db.query(Payment).filter_by(sale_id=sale_id).first()
+async def mpesa_checker(sale_id: int, db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(
+        select(Payment.trans_code, Payment.amount).where(Payment.sale_id == sale_id).limit(1)
+    )
+    payment = result.first()
     if not payment:
         raise HTTPException(status_code=404, detail="Payment not found")
     return {
@@ -309,6 +525,43 @@ def mpesa_checker(sale_id: int):
         "amount": payment.amount
     }
 
+# --- MPesa Status (long-poll) ---
+# Returns as soon as the sale's payment leaves PENDING, or after `timeout`
+# seconds, at which point Daraja is queried directly as a fallback
+@app.get("/mpesa/status/{sale_id}")
+async def mpesa_status(sale_id: int, timeout: float = Query(PAYMENT_STATUS_TIMEOUT, ge=0, le=60)):
+    waiter = payment_events.subscribe(sale_id)
+    try:
+        payment = await load_payment(sale_id)
+        if not payment:
+            raise HTTPException(status_code=404, detail="Payment not found")
+        if payment.trans_code != "PENDING":
+            return {"trans_code": payment.trans_code, "amount": payment.amount}
+
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            pass
+
+        # The callback may have been handled by another worker
+        payment = await load_payment(sale_id)
+        if payment.trans_code != "PENDING":
+            return {"trans_code": payment.trans_code, "amount": payment.amount}
+
+        res = await mpesa_client.query_stk_push(payment.crid)
+        failure = parse_query_failure(payment.crid, res)
+        if failure:
+            await callback_ingestor.apply([failure])
+            return {"trans_code": failure["trans_code"], "amount": failure["amount"]}
+        return {
+            "trans_code": payment.trans_code,
+            "amount": payment.amount,
+            "result_code": res.get("ResultCode"),
+            "result_desc": res.get("ResultDesc") or res.get("errorMessage") or res.get("error"),
+        }
+    finally:
+        payment_events.unsubscribe(sale_id, waiter)
+
 # Why use fastapi?
 # 1. Type hints - We can validate the data type expected by a route.
 # 2. Pydantic model - Classes/Objects which convert JSON to an object and Pydantic to validate.
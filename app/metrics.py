@@ -0,0 +1,294 @@
+import bisect
+import contextvars
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.datastructures import MutableHeaders
+from starlette.responses import PlainTextResponse
+
+from app.cache import cache
+from app.auth.passwords import password_service
+from app.resilience import CIRCUIT_STATES, providers
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+
+def format_labels(names, values, extra=""):
+    pairs = [f'{n}="{escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+# --- Metric types (Prometheus text exposition format) ---
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *label_values):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for label_values, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.labels, label_values)} {format_value(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.labels = labels
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for label_values, (counts, total, count) in sorted(self.series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += bucket_count
+                    le = f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{format_labels(self.labels, label_values, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{format_labels(self.labels, label_values)} {format_value(total)}")
+                lines.append(f"{self.name}_count{format_labels(self.labels, label_values)} {count}")
+        return lines
+
+# Values read at scrape time; `collect` returns [(label_values, value)]
+class Gauge:
+    def __init__(self, name: str, help: str, collect, labels: tuple = (), kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.collect = collect
+        self.labels = labels
+        self.kind = kind
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for label_values, value in self.collect():
+            lines.append(f"{self.name}{format_labels(self.labels, label_values)} {format_value(value)}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                print("Error collecting metric", metric.name, e)
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+requests_total = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route and status", ("method", "route", "status")))
+request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency", LATENCY_BUCKETS, ("method", "route")))
+request_queries = registry.register(Histogram(
+    "http_request_db_queries", "SQL statements issued per request", QUERY_COUNT_BUCKETS, ("method", "route")))
+request_db_seconds = registry.register(Counter(
+    "http_request_db_seconds_total", "Time spent in SQL statements by route", ("method", "route")))
+request_pool_wait_seconds = registry.register(Counter(
+    "http_request_db_pool_wait_seconds_total", "Time spent waiting for a pooled connection by route", ("method", "route")))
+query_duration = registry.register(Histogram(
+    "db_query_duration_seconds", "SQL statement latency (all callers)", LATENCY_BUCKETS, ("engine",)))
+pool_wait = registry.register(Histogram(
+    "db_pool_wait_seconds", "Time to check a connection out of the pool", POOL_WAIT_BUCKETS, ("engine",)))
+
+# --- Per-request accounting ---
+class RequestStats:
+    __slots__ = ("queries", "query_seconds", "pool_wait_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+
+    def server_timing(self, elapsed: float) -> str:
+        return (
+            f"app;dur={elapsed * 1000:.1f}, "
+            f'db;dur={self.query_seconds * 1000:.1f};desc="{self.queries} queries", '
+            f"pool;dur={self.pool_wait_seconds * 1000:.1f}"
+        )
+
+# Set by the middleware for the duration of a request. It is visible to
+# SQLAlchemy's greenlets and to threadpool calls, so statements issued on
+# behalf of a request are charged to it; background workers see None.
+current_request = contextvars.ContextVar("current_request", default=None)
+
+# --- SQLAlchemy hooks ---
+# The start time lives on the statement's execution context, so a statement
+# that raises (and never reaches after_cursor_execute) leaves nothing behind
+# on the pooled connection
+def instrument_engine(engine, label: str):
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_query_start", None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        query_duration.observe(elapsed, label)
+        stats = current_request.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.query_seconds += elapsed
+
+    if isinstance(engine.pool, QueuePool):
+        pools[label] = engine.pool
+
+# Queue pools of the instrumented engines, by label
+pools = {}
+
+registry.register(Gauge(
+    "db_pool_checked_out", "Connections currently checked out of the pool",
+    lambda: [((label,), pool.checkedout()) for label, pool in pools.items()], ("engine",)))
+registry.register(Gauge(
+    "db_pool_overflow", "Connections open beyond pool_size",
+    lambda: [((label,), max(pool.overflow(), 0)) for label, pool in pools.items()], ("engine",)))
+
+# Pools that time how long a checkout waits (including opening a new
+# connection when the pool is below its size)
+class TimedPoolMixin:
+    metrics_label = "sync"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            elapsed = time.perf_counter() - start
+            pool_wait.observe(elapsed, self.metrics_label)
+            stats = current_request.get()
+            if stats is not None:
+                stats.pool_wait_seconds += elapsed
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    metrics_label = "sync"
+
+class TimedAsyncAdaptedQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    metrics_label = "async"
+
+# --- Application-level gauges ---
+registry.register(Gauge(
+    "cache_hits_total", "Read cache hits by namespace",
+    lambda: [((ns,), s["hits"]) for ns, s in cache.stats().items()], ("namespace",), "counter"))
+registry.register(Gauge(
+    "cache_misses_total", "Read cache misses by namespace",
+    lambda: [((ns,), s["misses"]) for ns, s in cache.stats().items()], ("namespace",), "counter"))
+registry.register(Gauge(
+    "password_hash_pending", "Password hash/verify jobs queued or running",
+    lambda: [((), password_service.stats()["pending"])]))
+registry.register(Gauge(
+    "password_hash_completed_total", "Password hash/verify jobs completed",
+    lambda: [((), password_service.stats()["completed"])], kind="counter"))
+registry.register(Gauge(
+    "password_hash_rejected_total", "Password jobs rejected because the pool was full",
+    lambda: [((), password_service.stats()["rejected"])], kind="counter"))
+registry.register(Gauge(
+    "password_hash_seconds_total", "Time spent hashing and verifying passwords",
+    lambda: [((), password_service.stats()["total_seconds"])], kind="counter"))
+
+# Outbound providers (app/resilience.py)
+def provider_stats():
+    return [(name, provider.stats()) for name, provider in sorted(providers.items())]
+
+registry.register(Gauge(
+    "outbound_circuit_state", "Circuit breaker state: 0 closed, 1 half-open, 2 open",
+    lambda: [((name,), CIRCUIT_STATES[s["state"]]) for name, s in provider_stats()], ("provider",)))
+registry.register(Gauge(
+    "outbound_circuit_opened_total", "Times the circuit breaker opened",
+    lambda: [((name,), s["opened"]) for name, s in provider_stats()], ("provider",), "counter"))
+registry.register(Gauge(
+    "outbound_calls_in_flight", "Provider calls in progress",
+    lambda: [((name,), s["in_flight"]) for name, s in provider_stats()], ("provider",)))
+registry.register(Gauge(
+    "outbound_calls_total", "Provider calls by outcome",
+    lambda: [((name, outcome), count) for name, s in provider_stats() for outcome, count in sorted(s["calls"].items())],
+    ("provider", "outcome"), "counter"))
+registry.register(Gauge(
+    "outbound_throttled_seconds_total", "Time calls waited for the provider rate limit",
+    lambda: [((name,), s["throttled_seconds"]) for name, s in provider_stats()], ("provider",), "counter"))
+
+# --- ASGI middleware ---
+# Records latency, status and the request's SQL usage under the matched route
+# template (not the raw path, to keep label cardinality bounded) and, when
+# enabled, reports the same numbers to the client as a Server-Timing header.
+class MetricsMiddleware:
+    def __init__(self, app, server_timing: bool = True):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", stats.server_timing(time.perf_counter() - start))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_request.reset(token)
+            elapsed = time.perf_counter() - start
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            requests_total.inc(1, method, path, str(status))
+            request_duration.observe(elapsed, method, path)
+            request_queries.observe(stats.queries, method, path)
+            request_db_seconds.inc(stats.query_seconds, method, path)
+            request_pool_wait_seconds.inc(stats.pool_wait_seconds, method, path)
+
+async def metrics_endpoint():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -1,12 +1,55 @@
-from sqlalchemy import create_engine, Integer, String, Float, Column, ForeignKey, DateTime
+from sqlalchemy import create_engine, Integer, String, Float, Column, ForeignKey, DateTime, Date, Index
 from sqlalchemy.orm import sessionmaker, declarative_base, relationship
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from datetime import datetime
-from app.config import DB_URL
-
-engine = create_engine(DB_URL)
+from app.config import (DB_URL, ASYNC_DB_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING,
+                        METRICS_ENABLED)
+from app.metrics import TimedQueuePool, TimedAsyncAdaptedQueuePool, instrument_engine
+
+# One pooled engine per worker process; every request checks out its own connection
+engine = create_engine(
+    DB_URL,
+    poolclass=TimedQueuePool if METRICS_ENABLED else QueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+)
 session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Session-per-request dependency
+def get_db():
+    db = session()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Async engine used by the routes: concurrency is bounded by this pool rather
+# than by Starlette's threadpool. SQLite (aiosqlite, for tests) keeps its default pool.
+async_pool_options = {} if ASYNC_DB_URL.startswith("sqlite") else {
+    "poolclass": TimedAsyncAdaptedQueuePool if METRICS_ENABLED else AsyncAdaptedQueuePool,
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_RECYCLE,
+}
+async_engine = create_async_engine(ASYNC_DB_URL, pool_pre_ping=DB_POOL_PRE_PING, **async_pool_options)
+async_session = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# Query count and time per statement (see app.metrics)
+if METRICS_ENABLED:
+    instrument_engine(engine, "sync")
+    instrument_engine(async_engine.sync_engine, "async")
+
+# Async session-per-request dependency
+async def get_async_db():
+    async with async_session() as db:
+        yield db
+
 # Creating models
 # Product model
 class Product(Base):
@@ -20,14 +63,22 @@ class Product(Base):
 class Sale(Base):
     __tablename__='sales'
     id = Column(Integer, primary_key=True)
-    pid = Column(Integer, ForeignKey('products.id'), nullable=False)
+    pid = Column(Integer, ForeignKey('products.id'), nullable=False, index=True)
     quantity = Column(Integer, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
 
     # Relationship for multiple products per sale
     details = relationship("SalesDetails", back_populates="sale")
     payments = relationship("Payment", back_populates="sale")
 
+# Daily per-product sales rollup backing the dashboard.
+# Only quantities are stored, so price changes are picked up at read time.
+class SalesRollup(Base):
+    __tablename__='sales_rollups'
+    day = Column(Date, primary_key=True)
+    pid = Column(Integer, ForeignKey('products.id'), primary_key=True)
+    quantity = Column(Integer, nullable=False, default=0)
+
 # SalesDetails model
 class SalesDetails(Base):
     __tablename__='sales_details'
@@ -46,10 +97,12 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     full_name = Column(String, nullable=False)
     email = Column(String, unique=True, nullable=False, index=True)
-    phone = Column(String, nullable=True)  # Optional SMS OTP
+    phone = Column(String, nullable=True, index=True)  # Optional SMS OTP
     password = Column(String, nullable=False)
+    # Tokens issued before this time are rejected (set on password reset)
+    tokens_revoked_at = Column(DateTime, nullable=True)
 
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     updated_at = Column(
         DateTime,
         default=datetime.utcnow,
@@ -59,29 +112,62 @@ class User(Base):
     otps = relationship("OTP", backref="user", cascade="all, delete-orphan")
 
 
-# OTP model
+# OTP model: at most one active code per user, stored as an HMAC of the code
 class OTP(Base):
     __tablename__='otps'
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
-    otp = Column(String(4), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, unique=True, index=True)
+    otp_hash = Column(String(64), nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+# Individually revoked access tokens (logout), kept until the token would have expired
+class RevokedToken(Base):
+    __tablename__='revoked_tokens'
+    jti = Column(String(32), primary_key=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+# Outbound notification outbox (OTP email / SMS), drained by app.notifications
+class Notification(Base):
+    __tablename__='notifications'
+    id = Column(Integer, primary_key=True)
+    channel = Column(String(10), nullable=False)  # email | sms
+    recipient = Column(String, nullable=False)
+    subject = Column(String, nullable=True)
+    body = Column(String, nullable=False)
+    status = Column(String(10), nullable=False, default="pending")  # pending | sent | failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (Index('ix_notifications_status_next_attempt_at', 'status', 'next_attempt_at'),)
+
 # Payment model
 class Payment(Base):
     __tablename__='payments'
     id = Column(Integer, primary_key=True)
-    sale_id = Column(Integer, ForeignKey('sales.id'), nullable=False)
+    sale_id = Column(Integer, ForeignKey('sales.id'), nullable=False, index=True)
     mrid = Column(String(100), nullable=False)
-    crid = Column(String(100), nullable=False)
+    crid = Column(String(100), nullable=False, unique=True, index=True)
     amount = Column(Float, nullable=True)
     trans_code = Column(String(100), nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    # Amount sent in the STK push (Daraja charges it whole); settles a query result, which carries none
+    requested_amount = Column(Float, nullable=True)
 
     sale = relationship("Sale", back_populates="payments")
 
-# This is the correct way to create tables
-Base.metadata.create_all(bind=engine)
+    __table_args__ = (
+        Index('ix_payments_mrid_crid', 'mrid', 'crid'),
+        Index('ix_payments_trans_code_created_at', 'trans_code', 'created_at'),
+    )
+
+# The schema is managed by the Alembic migrations in migrations/ and applied
+# once per deploy with `alembic upgrade head`, not on every worker start.
 
 
 # from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
@@ -1,7 +1,13 @@
 # mpesa.py
-import requests, base64
-from requests.auth import HTTPBasicAuth
+import asyncio, base64, time
+import httpx
 from datetime import datetime
+from app.resilience import CircuitOpenError, Provider
+from app.config import (
+    MPESA_BASE_URL, MPESA_TIMEOUT_SECONDS, MPESA_MAX_RETRIES, MPESA_MAX_CONNECTIONS,
+    MPESA_RATE_PER_SECOND, MPESA_BURST, MPESA_CONCURRENCY, MPESA_CALL_TIMEOUT_SECONDS,
+    CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS,
+)
 
 # --- Sandbox Credentials ---
 consumer_key = "tnWQLSS6IbyOlP7P91eEaQBe7WVD0Dn96DApWvjc8o3gUcJ0"
@@ -10,75 +16,182 @@ short_code = "174379"
 pass_key = "bfb279f9aa9bdbcf158e97dd71a467cd2e0c893059b10f78e6b72ada1ed2c919"
 
 # --- API Endpoints ---
-token_api = "https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"
-push_api = "https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest"
-stk_push_query_api = "https://sandbox.safaricom.co.ke/mpesa/stkpushquery/v1/query"
+base_url = MPESA_BASE_URL
+token_api = "/oauth/v1/generate?grant_type=client_credentials"
+push_api = "/mpesa/stkpush/v1/processrequest"
+stk_push_query_api = "/mpesa/stkpushquery/v1/query"
 callback_url = "https://api.my-duka.co.ke/mpesa/callback"
 
-# --- Get Access Token ---
-def get_mpesa_access_token():
-    try:
-        res = requests.get(token_api, auth=HTTPBasicAuth(consumer_key, consumer_secret))
-        res.raise_for_status()
-        token = res.json().get("access_token")
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
-        print("✅ Access token retrieved:", token)
-        return headers
-    except Exception as e:
-        print("❌ Error getting access token:", str(e))
-        raise e
+# Refresh the access token this many seconds before Daraja says it expires
+TOKEN_EXPIRY_MARGIN = 60
+RETRY_BACKOFF_SECONDS = 0.5
+
+# Errors where the request never reached Daraja, so even an STK push is safe to resend
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# Only Daraja's own trouble (no connection, timeouts, 5xx, throttling) counts
+# against the circuit; a request it rejects shows it is up
+def daraja_failure(e: Exception) -> bool:
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code >= 500 or e.response.status_code == 429
+    return True
+
+# Every Daraja request goes through here, the reconciler's queries included
+daraja = Provider(
+    "daraja",
+    rate=MPESA_RATE_PER_SECOND,
+    burst=MPESA_BURST,
+    concurrency=MPESA_CONCURRENCY,
+    timeout=MPESA_CALL_TIMEOUT_SECONDS,
+    failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+    reset_seconds=CIRCUIT_RESET_SECONDS,
+    is_failure=daraja_failure,
+)
 
 # --- Generate STK Push Password ---
-def generate_password():
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+def generate_password(timestamp: str):
     password_str = short_code + pass_key + timestamp
     return base64.b64encode(password_str.encode()).decode("utf-8")
 
-# --- Send STK Push ---
-def send_stk_push(amount: float, phone_number: str, sale_id: str):
-    headers = get_mpesa_access_token()
-    payload = {
-        "BusinessShortCode": short_code,
-        "Password": generate_password(),
-        "Timestamp": datetime.now().strftime("%Y%m%d%H%M%S"),
-        "TransactionType": "CustomerPayBillOnline",
-        "Amount": int(amount),
-        "PartyA": phone_number,
-        "PartyB": short_code,
-        "PhoneNumber": phone_number,
-        "CallBackURL": callback_url,
-        "AccountReference": str(sale_id),
-        "TransactionDesc": "FastAPI Payment"
-    }
-
-    try:
-        print("🔥 STK PUSH PAYLOAD 🔥", payload)
-        response = requests.post(push_api, json=payload, headers=headers)
-        print("🔥 STK PUSH RESPONSE 🔥", response.json())
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        print("❌ ERROR SENDING STK PUSH ❌", str(e))
-        return {"error": str(e)}
-
-# --- Query STK Push Status (Optional) ---
-def query_stk_push(checkout_request_id: str):
-    headers = get_mpesa_access_token()
-    payload = {
-        "BusinessShortCode": short_code,
-        "Password": generate_password(),
-        "Timestamp": datetime.now().strftime("%Y%m%d%H%M%S"),
-        "CheckoutRequestID": checkout_request_id
-    }
-    try:
-        response = requests.post(stk_push_query_api, json=payload, headers=headers)
-        print("STK QUERY PAYLOAD:", payload)
-        print("STK QUERY RESPONSE:", response.json())
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        print("❌ ERROR QUERYING STK PUSH ❌", str(e))
-        return {"error": str(e)}
+# Async Daraja client: one pooled connection set per process and a cached
+# OAuth token, so an STK push costs a single round-trip in the steady state.
+class MpesaClient:
+    def __init__(
+        self,
+        base_url: str = base_url,
+        consumer_key: str = consumer_key,
+        consumer_secret: str = consumer_secret,
+        timeout: float = MPESA_TIMEOUT_SECONDS,
+        max_retries: int = MPESA_MAX_RETRIES,
+        max_connections: int = MPESA_MAX_CONNECTIONS,
+        provider: Provider = daraja,
+    ):
+        self.base_url = base_url
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_connections = max_connections
+        self.provider = provider
+        self.client = None
+        self.token = None
+        self.token_expires_at = 0.0
+        self.token_lock = asyncio.Lock()
+
+    def get_client(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections),
+            )
+        return self.client
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    # --- Get Access Token ---
+    async def get_access_token(self):
+        if self.token and time.monotonic() < self.token_expires_at:
+            return self.token
+
+        # Single-flight: concurrent callers wait for one refresh instead of each fetching a token
+        async with self.token_lock:
+            if self.token and time.monotonic() < self.token_expires_at:
+                return self.token
+
+            res = await self.send(
+                "GET",
+                token_api,
+                auth=(self.consumer_key, self.consumer_secret),
+            )
+            data = res.json()
+            expires_in = int(data.get("expires_in", 3599))
+            self.token = data.get("access_token")
+            self.token_expires_at = time.monotonic() + max(expires_in - TOKEN_EXPIRY_MARGIN, 0)
+            print("✅ Access token refreshed, expires in", expires_in)
+            return self.token
+
+    def invalidate_token(self):
+        self.token = None
+        self.token_expires_at = 0.0
+
+    async def request(self, method: str, url: str, **kwargs):
+        res = await self.get_client().request(method, url, **kwargs)
+        res.raise_for_status()
+        return res
+
+    # Send a request through the provider guard, retrying with exponential backoff.
+    # Non-idempotent calls are only retried when the connection was never made;
+    # nothing is retried once the circuit is open or the deadline has passed.
+    async def send(self, method: str, url: str, idempotent: bool = True, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return await self.provider.call(self.request, method, url, **kwargs)
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                retryable = isinstance(e, CONNECT_ERRORS) or (
+                    idempotent and (isinstance(e, httpx.TransportError) or e.response.status_code >= 500)
+                )
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                await asyncio.sleep(RETRY_BACKOFF_SECONDS * (2 ** attempt))
+                attempt += 1
+
+    # POST to Daraja with the cached token, refreshing it once if it was rejected
+    async def post(self, url: str, payload: dict, idempotent: bool):
+        token = await self.get_access_token()
+        try:
+            res = await self.send("POST", url, idempotent=idempotent, json=payload, headers={"Authorization": f"Bearer {token}"})
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != 401:
+                raise
+            self.invalidate_token()
+            token = await self.get_access_token()
+            res = await self.send("POST", url, idempotent=idempotent, json=payload, headers={"Authorization": f"Bearer {token}"})
+        return res.json()
+
+    # --- Send STK Push ---
+    async def send_stk_push(self, amount: float, phone_number: str, sale_id: str):
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        payload = {
+            "BusinessShortCode": short_code,
+            "Password": generate_password(timestamp),
+            "Timestamp": timestamp,
+            "TransactionType": "CustomerPayBillOnline",
+            "Amount": int(amount),
+            "PartyA": phone_number,
+            "PartyB": short_code,
+            "PhoneNumber": phone_number,
+            "CallBackURL": callback_url,
+            "AccountReference": str(sale_id),
+            "TransactionDesc": "FastAPI Payment"
+        }
+
+        try:
+            return await self.post(push_api, payload, idempotent=False)
+        except CircuitOpenError as e:
+            print("❌ M-PESA UNAVAILABLE ❌", str(e))
+            return {"error": str(e), "retry_after": e.retry_after}
+        except Exception as e:
+            print("❌ ERROR SENDING STK PUSH ❌", str(e))
+            return {"error": str(e)}
+
+    # --- Query STK Push Status ---
+    async def query_stk_push(self, checkout_request_id: str):
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        payload = {
+            "BusinessShortCode": short_code,
+            "Password": generate_password(timestamp),
+            "Timestamp": timestamp,
+            "CheckoutRequestID": checkout_request_id
+        }
+        try:
+            return await self.post(stk_push_query_api, payload, idempotent=True)
+        except Exception as e:
+            print("❌ ERROR QUERYING STK PUSH ❌", str(e))
+            return {"error": str(e)}
+
+mpesa_client = MpesaClient()
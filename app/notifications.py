@@ -0,0 +1,251 @@
+import asyncio
+import smtplib
+from datetime import datetime, timedelta
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+import africastalking
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Notification, session
+from app.resilience import CircuitOpenError, Provider
+from app.config import (
+    BREVO_SMTP_USERNAME, BREVO_SMTP_SERVER, BREVO_SMTP_PORT, BREVO_SMTP_PASSWORD, SMTP_FROM_EMAIL,
+    AT_USERNAME, AT_API_KEY,
+    NOTIFY_POLL_SECONDS, NOTIFY_BATCH_SIZE, NOTIFY_MAX_ATTEMPTS, NOTIFY_RETRY_BASE_SECONDS, NOTIFY_CLAIM_SECONDS,
+    SMS_RATE_PER_SECOND, SMS_BURST, SMS_CONCURRENCY, SMS_TIMEOUT_SECONDS,
+    SMTP_RATE_PER_SECOND, SMTP_BURST, SMTP_CONCURRENCY, SMTP_TIMEOUT_SECONDS,
+    CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS,
+)
+
+# ---------------- SMS INIT ----------------
+try:
+    africastalking.initialize(AT_USERNAME, AT_API_KEY)
+    # initialize() replaces the module's service classes with ready instances
+    sms = africastalking.SMS
+except Exception as e:
+    print("Africastalking init failed:", e)
+    sms = None
+
+# ---------------- PROVIDER GUARDS ----------------
+# A refused recipient is a bad address, not a sign the SMTP server is down
+smtp_provider = Provider(
+    "smtp",
+    rate=SMTP_RATE_PER_SECOND,
+    burst=SMTP_BURST,
+    concurrency=SMTP_CONCURRENCY,
+    timeout=SMTP_TIMEOUT_SECONDS,
+    failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+    reset_seconds=CIRCUIT_RESET_SECONDS,
+    is_failure=lambda e: not isinstance(e, smtplib.SMTPRecipientsRefused),
+)
+sms_provider = Provider(
+    "sms",
+    rate=SMS_RATE_PER_SECOND,
+    burst=SMS_BURST,
+    concurrency=SMS_CONCURRENCY,
+    timeout=SMS_TIMEOUT_SECONDS,
+    failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+    reset_seconds=CIRCUIT_RESET_SECONDS,
+)
+
+# Add a message to the outbox. Runs in the caller's transaction, so the
+# message is only sent if the caller commits.
+def enqueue_notification(db: AsyncSession, channel: str, recipient: str, body: str, subject: str = None):
+    db.add(Notification(channel=channel, recipient=recipient, subject=subject, body=body))
+
+# Email sender that keeps one authenticated SMTP connection open across
+# messages and batches, reconnecting only when the server has dropped it
+class SMTPSender:
+    def __init__(self):
+        self.server = None
+
+    def connect(self):
+        server = smtplib.SMTP(BREVO_SMTP_SERVER, int(BREVO_SMTP_PORT), timeout=SMTP_TIMEOUT_SECONDS)
+        server.starttls()
+        server.login(BREVO_SMTP_USERNAME, BREVO_SMTP_PASSWORD)
+        return server
+
+    def get_server(self):
+        if self.server is not None:
+            try:
+                self.server.noop()
+                return self.server
+            except smtplib.SMTPException:
+                self.close()
+        self.server = self.connect()
+        return self.server
+
+    def send(self, recipient: str, subject: str, body: str):
+        msg = MIMEMultipart()
+        msg["From"] = SMTP_FROM_EMAIL
+        msg["To"] = recipient
+        msg["Subject"] = subject or ""
+        msg.attach(MIMEText(body, "plain"))
+        try:
+            self.get_server().send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            self.close()
+            self.get_server().send_message(msg)
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except smtplib.SMTPException:
+                pass
+            self.server = None
+
+# Columns a dispatch round writes back for each message
+OUTCOME_FIELDS = ("id", "status", "attempts", "last_error", "next_attempt_at", "sent_at")
+
+# Claim due messages by moving their next attempt NOTIFY_CLAIM_SECONDS ahead,
+# then commit, so no transaction stays open while they are sent. Other
+# dispatchers skip them; if this one dies mid-send they become due again
+# (delivery is at least once). Returns the claimed messages as dicts.
+def claim_due(batch_size: int = NOTIFY_BATCH_SIZE) -> list:
+    db = session()
+    try:
+        now = datetime.utcnow()
+        due = db.query(Notification).filter(
+            Notification.status == "pending",
+            Notification.next_attempt_at <= now,
+        ).order_by(Notification.next_attempt_at).limit(batch_size).with_for_update(skip_locked=True).all()
+
+        claimed = []
+        for n in due:
+            n.next_attempt_at = now + timedelta(seconds=NOTIFY_CLAIM_SECONDS)
+            claimed.append({
+                "id": n.id, "channel": n.channel, "recipient": n.recipient, "subject": n.subject, "body": n.body,
+                "status": n.status, "attempts": n.attempts, "last_error": n.last_error,
+                "next_attempt_at": n.next_attempt_at, "sent_at": n.sent_at,
+            })
+        db.commit()
+        return claimed
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+# Claim due messages, send them and record the outcome.
+# Failed messages are retried with exponential backoff up to NOTIFY_MAX_ATTEMPTS.
+# While a provider's circuit is open its messages wait for it to close without
+# using up attempts.
+def dispatch_batch(sender: SMTPSender, batch_size: int = NOTIFY_BATCH_SIZE):
+    due = claim_due(batch_size)
+    if not due:
+        return 0
+    now = datetime.utcnow()
+
+    def mark_failed(n, error):
+        n["attempts"] += 1
+        n["last_error"] = str(error)
+        if n["attempts"] >= NOTIFY_MAX_ATTEMPTS:
+            n["status"] = "failed"
+        else:
+            n["next_attempt_at"] = now + timedelta(seconds=NOTIFY_RETRY_BASE_SECONDS * 2 ** (n["attempts"] - 1))
+
+    def defer(n, error):
+        n["last_error"] = str(error)
+        n["next_attempt_at"] = now + timedelta(seconds=error.retry_after)
+
+    def mark_sent(n):
+        n["attempts"] += 1
+        n["status"] = "sent"
+        n["sent_at"] = datetime.utcnow()
+
+    for n in [n for n in due if n["channel"] == "email"]:
+        try:
+            smtp_provider.call_sync(sender.send, n["recipient"], n["subject"], n["body"])
+            mark_sent(n)
+        except CircuitOpenError as e:
+            defer(n, e)
+        except Exception as e:
+            sender.close()
+            mark_failed(n, e)
+
+    # Africa's Talking takes many recipients per request, but only messages
+    # with the same body can share one. That batches broadcasts; OTPs are
+    # unique, so each goes in a request of its own.
+    sms_groups = {}
+    for n in due:
+        if n["channel"] == "sms":
+            sms_groups.setdefault(n["body"], []).append(n)
+    for body, group in sms_groups.items():
+        try:
+            if sms is None:
+                raise RuntimeError("SMS provider not initialised")
+            sms_provider.call_sync(
+                sms.send, message=body, recipients=[n["recipient"] for n in group], timeout=SMS_TIMEOUT_SECONDS,
+            )
+            for n in group:
+                mark_sent(n)
+        except CircuitOpenError as e:
+            for n in group:
+                defer(n, e)
+        except Exception as e:
+            for n in group:
+                mark_failed(n, e)
+
+    db = session()
+    try:
+        db.execute(update(Notification), [{k: n[k] for k in OUTCOME_FIELDS} for n in due])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return len(due)
+
+# Background worker draining the outbox. It polls every NOTIFY_POLL_SECONDS
+# and can be woken early (from any thread) when a message is enqueued.
+class NotificationDispatcher:
+    def __init__(self, poll_seconds: float = NOTIFY_POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self.sender = SMTPSender()
+        self.loop = None
+        self.wakeup = None
+        self.worker = None
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        self.worker = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.worker is None:
+            return
+        self.worker.cancel()
+        try:
+            await self.worker
+        except asyncio.CancelledError:
+            pass
+        self.worker = None
+        await run_in_threadpool(self.sender.close)
+
+    def wake(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    async def run(self):
+        while True:
+            try:
+                sent = await run_in_threadpool(dispatch_batch, self.sender)
+            except Exception as e:
+                print("Error dispatching notifications:", e)
+                sent = 0
+
+            # A full batch means more may be waiting
+            if sent >= NOTIFY_BATCH_SIZE:
+                continue
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+
+notification_dispatcher = NotificationDispatcher()
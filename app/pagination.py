@@ -0,0 +1,51 @@
+from datetime import datetime
+from typing import Optional
+from fastapi import Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Cursor params for the list endpoints
+class CursorParams:
+    def __init__(
+        self,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        after: Optional[int] = Query(None, description="Return rows with id greater than this cursor"),
+    ):
+        self.limit = limit
+        self.after = after
+
+# Cursor plus a created_at range, for tables that record when rows were created
+class PageParams(CursorParams):
+    def __init__(
+        self,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        after: Optional[int] = Query(None, description="Return rows with id greater than this cursor"),
+        start: Optional[datetime] = Query(None, description="Only rows created at or after this time"),
+        end: Optional[datetime] = Query(None, description="Only rows created before this time"),
+    ):
+        super().__init__(limit, after)
+        self.start = start
+        self.end = end
+
+# Apply the date range to a select() on a created_at column
+def filter_created(stmt, created_at_column, start: Optional[datetime], end: Optional[datetime]):
+    if start is not None:
+        stmt = stmt.where(created_at_column >= start)
+    if end is not None:
+        stmt = stmt.where(created_at_column < end)
+    return stmt
+
+# Keyset pagination of a select() on a monotonically increasing id column.
+# Fetches one extra row to know whether another page exists and, if so,
+# exposes the cursor for it in the X-Next-Cursor header.
+async def paginate(db: AsyncSession, stmt, id_column, page: CursorParams, response: Response):
+    if page.after is not None:
+        stmt = stmt.where(id_column > page.after)
+    result = await db.execute(stmt.order_by(id_column).limit(page.limit + 1))
+    rows = result.all()
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        response.headers["X-Next-Cursor"] = str(rows[-1].id)
+    return rows
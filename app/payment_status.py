@@ -0,0 +1,43 @@
+import asyncio
+from sqlalchemy import select
+
+from app.models import Payment, async_session
+
+# In-process pub/sub of payment status changes, keyed by sale id.
+# Waiters are futures resolved by the callback ingestor once a payment
+# for their sale leaves PENDING.
+class PaymentEvents:
+    def __init__(self):
+        self.waiters = {}
+
+    def subscribe(self, sale_id: int):
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(sale_id, set()).add(waiter)
+        return waiter
+
+    def unsubscribe(self, sale_id: int, waiter):
+        waiters = self.waiters.get(sale_id)
+        if waiters is None:
+            return
+        waiters.discard(waiter)
+        if not waiters:
+            del self.waiters[sale_id]
+
+    def publish(self, sale_id: int, status: dict):
+        for waiter in self.waiters.pop(sale_id, ()):
+            if not waiter.done():
+                waiter.set_result(status)
+
+payment_events = PaymentEvents()
+
+# Latest payment for a sale, read with a short-lived session so long-polling
+# clients do not hold a pooled connection while they wait
+async def load_payment(sale_id: int):
+    async with async_session() as db:
+        result = await db.execute(
+            select(Payment.crid, Payment.amount, Payment.trans_code)
+            .where(Payment.sale_id == sale_id)
+            .order_by(Payment.id.desc())
+            .limit(1)
+        )
+        return result.first()
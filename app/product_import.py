@@ -0,0 +1,186 @@
+import codecs
+import csv
+import json
+from typing import Optional
+
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Product
+
+IMPORT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+class ProductImportRow(BaseModel):
+    id: Optional[int] = None
+    name: str
+    buying_price: float
+    selling_price: float
+
+# The upload is malformed. Batches before the fault are already written;
+# import_products attaches its report so far as `report`.
+class ImportFormatError(Exception):
+    report = None
+
+# Decode an async stream of byte chunks into text chunks
+async def iter_text(chunks):
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    async for chunk in chunks:
+        piece = decoder.decode(chunk)
+        if piece:
+            yield piece
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+# Empty CSV cells mean "not given"
+def to_record(header, values):
+    return {key: (value if value != "" else None) for key, value in zip(header, values)}
+
+# Yield CSV records (dicts keyed by the header row) as the upload arrives.
+# Lines are held back while a quoted field spans a line break.
+async def iter_csv(chunks):
+    header = None
+    pending = ""
+    buffer = ""
+
+    def parse(record):
+        return next(csv.reader([record]))
+
+    async for piece in iter_text(chunks):
+        buffer += piece
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            pending = pending + "\n" + line if pending else line
+            if pending.count('"') % 2:
+                continue
+            record, pending = pending.rstrip("\r"), ""
+            if not record.strip():
+                continue
+            if header is None:
+                header = [h.strip() for h in parse(record)]
+                continue
+            yield to_record(header, parse(record))
+
+    record = (pending + "\n" + buffer if pending else buffer).rstrip("\r")
+    if record.strip():
+        if record.count('"') % 2:
+            raise ImportFormatError("Unterminated quoted field")
+        if header is None:
+            return
+        yield to_record(header, parse(record))
+
+# Yield the objects of a top-level JSON array as the upload arrives
+async def iter_json_array(chunks):
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    started = False
+    finished = False
+
+    async for piece in iter_text(chunks):
+        buffer = buffer[pos:] + piece
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if not started:
+                if buffer[pos] != "[":
+                    raise ImportFormatError("Expected a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                finished = True
+                pos += 1
+                break
+            try:
+                item, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                break  # incomplete value, wait for more data
+            yield item
+        if finished:
+            break
+
+    if not finished:
+        raise ImportFormatError("Invalid or truncated JSON array")
+
+# Explicit ids bypass the Postgres sequence; move it past the highest id.
+# Runs in the caller's transaction.
+async def sync_id_sequence(db: AsyncSession):
+    if db.bind.dialect.name != "postgresql":
+        return
+    await db.execute(text("SELECT setval(pg_get_serial_sequence('products', 'id'), COALESCE((SELECT MAX(id) FROM products), 1))"))
+
+# Upsert a batch of validated rows in one transaction.
+# Rows with an id update (or create) that product; rows without one are inserted.
+async def write_batch(db: AsyncSession, rows: list):
+    # A repeated id within one statement would make ON CONFLICT fail; the last row wins
+    with_id = list({r.id: r.model_dump() for r in rows if r.id is not None}.values())
+    without_id = [r.model_dump(exclude={"id"}) for r in rows if r.id is None]
+
+    if with_id:
+        dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+        stmt = dialect.insert(Product).values(with_id)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Product.id],
+            set_={
+                "name": stmt.excluded.name,
+                "buying_price": stmt.excluded.buying_price,
+                "selling_price": stmt.excluded.selling_price,
+            },
+        )
+        await db.execute(stmt)
+        # Before the id-less rows, so they take ids after the explicit ones
+        await sync_id_sequence(db)
+    if without_id:
+        await db.execute(Product.__table__.insert(), without_id)
+    await db.commit()
+
+# Validate records and hand them to `flush` IMPORT_BATCH_SIZE at a time.
+# A batch that fails to write is reported row by row and the import carries on.
+# Returns a summary with per-row errors (row numbers start at 1). A malformed
+# upload raises ImportFormatError carrying the summary of what was written;
+# the batch still being collected is not written.
+async def import_products(records, flush):
+    batch = []
+    row_numbers = []
+    report = {"processed": 0, "written": 0, "error_count": 0, "errors": []}
+
+    def add_error(row, error):
+        report["error_count"] += 1
+        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+            report["errors"].append({"row": row, "error": error})
+
+    async def write():
+        try:
+            await flush(batch)
+            report["written"] += len(batch)
+        except Exception as e:
+            for row in row_numbers:
+                add_error(row, str(e))
+
+    try:
+        async for record in records:
+            report["processed"] += 1
+            try:
+                batch.append(ProductImportRow.model_validate(record))
+                row_numbers.append(report["processed"])
+            except ValidationError as e:
+                add_error(report["processed"], [{"loc": err["loc"], "msg": err["msg"]} for err in e.errors()])
+                continue
+
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                await write()
+                batch, row_numbers = [], []
+    except ImportFormatError as e:
+        e.report = report
+        raise
+
+    if batch:
+        await write()
+    return report
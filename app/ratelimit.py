@@ -0,0 +1,147 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from starlette.responses import JSONResponse
+
+from app.auth.auth_service import jwt_handler
+from app.metrics import Gauge, registry
+from app.config import (
+    RATE_LIMIT_MAX_KEYS, RATE_LIMIT_LOGIN_PER_MINUTE, RATE_LIMIT_FORGOT_PASSWORD_PER_HOUR,
+    RATE_LIMIT_STKPUSH_PER_MINUTE,
+)
+
+# Storage interface. `hit` counts one request against `key` if it is within
+# `limit` requests per `window` seconds and returns 0, otherwise it returns the
+# seconds until the next request would be allowed. A shared store (e.g. Redis)
+# can implement it so every worker process enforces the same limits.
+class RateLimitBackend:
+    async def hit(self, key: str, limit: int, window: float) -> float:
+        raise NotImplementedError
+
+# In-process sliding window counter: the previous fixed window's count is
+# weighted by how much of it still overlaps the sliding window, so each key
+# costs three numbers however many requests it makes. Keys are evicted
+# least recently used first.
+class MemoryRateLimitBackend(RateLimitBackend):
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self.windows = OrderedDict()
+        self.lock = threading.Lock()
+
+    async def hit(self, key: str, limit: int, window: float) -> float:
+        now = time.time()
+        index, offset = divmod(now, window)
+        with self.lock:
+            entry = self.windows.get(key)
+            if entry is None:
+                current = previous = 0
+            elif entry[0] == index:
+                _, current, previous = entry
+            else:
+                current, previous = 0, entry[1] if entry[0] == index - 1 else 0
+
+            overlap = 1 - offset / window
+            if previous * overlap + current + 1 > limit:
+                # Rejected requests are not counted, so a client that backs off gets back in
+                if current + 1 > limit or previous == 0:
+                    return window - offset
+                return (1 - (limit - current - 1) / previous - offset / window) * window
+
+            self.windows[key] = (index, current + 1, previous)
+            self.windows.move_to_end(key)
+            while len(self.windows) > self.max_keys:
+                self.windows.popitem(last=False)
+        return 0.0
+
+# `limit` requests per `window` seconds for each client IP or each user
+# (by the access token's subject, falling back to the IP without one)
+class Limit:
+    def __init__(self, name: str, limit: int, window: float, per: str = "ip"):
+        self.name = name
+        self.limit = limit
+        self.window = window
+        self.per = per
+
+# Expensive endpoints by (method, path). Routes sharing a Limit share its budget.
+login_limit = Limit("login", RATE_LIMIT_LOGIN_PER_MINUTE, 60)
+DEFAULT_RULES = {
+    ("POST", "/auth/login"): [login_limit],
+    ("POST", "/auth/token"): [login_limit],
+    ("POST", "/auth/forgot-password"): [Limit("forgot_password", RATE_LIMIT_FORGOT_PASSWORD_PER_HOUR, 3600)],
+    ("POST", "/mpesa/stkpush"): [Limit("stkpush", RATE_LIMIT_STKPUSH_PER_MINUTE, 60, per="user")],
+}
+
+def client_ip(scope) -> str:
+    # Behind a proxy this is only the real client when uvicorn trusts its
+    # X-Forwarded-For (--proxy-headers / --forwarded-allow-ips)
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+def client_user(scope):
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer":
+                return None
+            try:
+                return jwt_handler.decode_token(token).get("sub")
+            except Exception:
+                return None
+    return None
+
+# Rejections by limit name, for the metrics gauge
+class RateLimitStats:
+    def __init__(self):
+        self.rejected = {}
+        self.lock = threading.Lock()
+
+    def reject(self, name: str):
+        with self.lock:
+            self.rejected[name] = self.rejected.get(name, 0) + 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return dict(self.rejected)
+
+rate_limit_stats = RateLimitStats()
+
+# Registered here: app.metrics is imported by app.models, so it cannot import this module
+registry.register(Gauge(
+    "rate_limited_requests_total", "Requests rejected with 429 by rate limit",
+    lambda: [((name,), count) for name, count in sorted(rate_limit_stats.stats().items())], ("limit",), "counter"))
+
+# --- ASGI middleware ---
+# Requests to other paths pass straight through after one dict lookup.
+# Over the limit the client gets 429 with Retry-After and the endpoint never runs.
+class RateLimitMiddleware:
+    def __init__(self, app, backend: RateLimitBackend = None, rules: dict = None):
+        self.app = app
+        self.backend = backend or MemoryRateLimitBackend()
+        self.rules = DEFAULT_RULES if rules is None else rules
+
+    async def __call__(self, scope, receive, send):
+        limits = self.rules.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+        if not limits:
+            await self.app(scope, receive, send)
+            return
+
+        retry_after = 0.0
+        for limit in limits:
+            client = client_user(scope) if limit.per == "user" else None
+            key = f"{limit.name}:user:{client}" if client else f"{limit.name}:ip:{client_ip(scope)}"
+            retry_after = await self.backend.hit(key, limit.limit, limit.window)
+            if retry_after:
+                rate_limit_stats.reject(limit.name)
+                break
+
+        if retry_after:
+            response = JSONResponse(
+                {"detail": "Too many requests"},
+                status_code=429,
+                headers={"Retry-After": str(max(math.ceil(retry_after), 1))},
+            )
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, text, tuple_
+
+from app.models import Payment, async_session
+from app.mpesa import mpesa_client
+from app.resilience import TokenBucket
+from app.callbacks import callback_ingestor, parse_query_result
+from app.config import (
+    RECONCILE_INTERVAL_SECONDS, RECONCILE_AFTER_SECONDS, RECONCILE_MAX_AGE_HOURS,
+    RECONCILE_BATCH_SIZE, RECONCILE_CONCURRENCY, RECONCILE_RATE_PER_SECOND,
+)
+
+# Held for a whole round so only one worker process reconciles at a time (Postgres only)
+RECONCILE_LOCK_ID = 0x4D504553
+
+logger = logging.getLogger(__name__)
+
+# Settles payments still PENDING long after their STK push (the callback was
+# lost or never sent) by asking Daraja for the result. Stale payments are read
+# in batches through the (trans_code, created_at) index, queried concurrently
+# under a semaphore and rate limit, and every final result in a batch is
+# applied with one bulk update through the callback ingestor, which also
+# wakes long-polling clients.
+class PaymentReconciler:
+    def __init__(
+        self,
+        interval: float = RECONCILE_INTERVAL_SECONDS,
+        stale_after: float = RECONCILE_AFTER_SECONDS,
+        max_age_hours: float = RECONCILE_MAX_AGE_HOURS,
+        batch_size: int = RECONCILE_BATCH_SIZE,
+        concurrency: int = RECONCILE_CONCURRENCY,
+        rate: float = RECONCILE_RATE_PER_SECOND,
+    ):
+        self.interval = interval
+        self.stale_after = timedelta(seconds=stale_after)
+        self.max_age = timedelta(hours=max_age_hours)
+        self.batch_size = batch_size
+        self.semaphore = asyncio.Semaphore(concurrency)
+        # Its own budget inside the Daraja limit, so a backlog leaves room for STK pushes
+        self.limiter = TokenBucket(rate)
+        self.worker = None
+
+    async def start(self):
+        self.worker = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker = None
+
+    async def run(self):
+        while True:
+            try:
+                checked, applied = await self.reconcile()
+                if checked:
+                    logger.info("Reconciled %d of %d stale payments", applied, checked)
+            except Exception:
+                logger.exception("Error reconciling payments")
+            await asyncio.sleep(self.interval)
+
+    async def check(self, crid: str, requested_amount: float):
+        async with self.semaphore:
+            await self.limiter.acquire()
+            res = await mpesa_client.query_stk_push(crid)
+        return parse_query_result(crid, res, requested_amount)
+
+    # One pass over the payments that were pending for at least `stale_after`
+    # (and at most `max_age`). Returns (checked, applied).
+    async def reconcile(self):
+        now = datetime.utcnow()
+        checked = applied = 0
+        async with async_session() as lock_db:
+            if lock_db.bind.dialect.name == "postgresql":
+                locked = await lock_db.scalar(text("SELECT pg_try_advisory_xact_lock(:id)"), {"id": RECONCILE_LOCK_ID})
+                if not locked:
+                    return 0, 0
+
+            cursor = None
+            while True:
+                stmt = select(Payment.id, Payment.crid, Payment.created_at, Payment.requested_amount).where(
+                    Payment.trans_code == "PENDING",
+                    Payment.created_at < now - self.stale_after,
+                    Payment.created_at >= now - self.max_age,
+                )
+                if cursor is not None:
+                    stmt = stmt.where(tuple_(Payment.created_at, Payment.id) > cursor)
+                async with async_session() as db:
+                    batch = (await db.execute(
+                        stmt.order_by(Payment.created_at, Payment.id).limit(self.batch_size)
+                    )).all()
+                if not batch:
+                    break
+                cursor = (batch[-1].created_at, batch[-1].id)
+
+                results = await asyncio.gather(*(self.check(p.crid, p.requested_amount) for p in batch))
+                updates = [u for u in results if u]
+                if updates:
+                    applied += len(await callback_ingestor.apply(updates))
+                checked += len(batch)
+        return checked, applied
+
+payment_reconciler = PaymentReconciler()
@@ -0,0 +1,212 @@
+import asyncio
+import math
+import threading
+import time
+
+# Providers by name, for the metrics gauges
+providers = {}
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+CIRCUIT_STATES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Raised instead of calling a provider whose circuit is open
+class CircuitOpenError(Exception):
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"{provider} is unavailable, retry in {math.ceil(retry_after)}s")
+        self.provider = provider
+        self.retry_after = retry_after
+
+# A call (including the wait for a slot) that ran past the provider's deadline
+class ProviderTimeout(Exception):
+    pass
+
+# Refills `rate` tokens per second up to `burst`. A caller takes a token at once
+# and sleeps until it is due, so waiters are served in arrival order.
+# A rate of 0 disables the limit.
+class TokenBucket:
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Take a token; returns how long to wait before using it
+    def reserve(self) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    async def acquire(self) -> float:
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+        return delay
+
+    def acquire_sync(self) -> float:
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+        return delay
+
+# Opens after `failure_threshold` consecutive failures and rejects calls for
+# `reset_seconds`. Then one trial call is let through (half-open): success
+# closes the circuit, failure opens it for another period.
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened_total = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == CLOSED:
+                return
+            remaining = self.opened_at + self.reset_seconds - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpenError(self.name, remaining)
+            # Other callers keep failing fast until the trial call reports back
+            # (or another period passes, if it never does)
+            self.state = HALF_OPEN
+            self.opened_at = time.monotonic()
+
+    def success(self):
+        with self.lock:
+            if self.state != CLOSED:
+                print(f"Circuit for {self.name} closed")
+            self.state = CLOSED
+            self.failures = 0
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                print(f"Circuit for {self.name} opened after {self.failures} failures")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.opened_total += 1
+
+# Guards the calls to one external provider: a circuit breaker, a cap on calls
+# in flight, a token-bucket rate limit and a deadline covering the wait for a
+# slot as well as the call. `is_failure` decides which exceptions count against
+# the circuit (a rejected request is the caller's fault, not the provider's).
+# Async callers use `call`; blocking clients running in a thread use `call_sync`,
+# where the deadline only bounds the wait and the client's own timeout the call.
+class Provider:
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: int,
+        concurrency: int,
+        timeout: float,
+        failure_threshold: int,
+        reset_seconds: float,
+        is_failure=lambda e: True,
+    ):
+        self.name = name
+        self.timeout = timeout
+        self.is_failure = is_failure
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_seconds)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.thread_semaphore = threading.BoundedSemaphore(concurrency)
+        self.in_flight = 0
+        self.calls = {}
+        self.throttled_seconds = 0.0
+        self.lock = threading.Lock()
+        providers[name] = self
+
+    def begin(self):
+        with self.lock:
+            self.in_flight += 1
+
+    # Count a call's outcome; `finished` when it had been started with begin()
+    def count(self, outcome: str, finished: bool = False):
+        with self.lock:
+            if finished:
+                self.in_flight -= 1
+            if outcome:
+                self.calls[outcome] = self.calls.get(outcome, 0) + 1
+
+    # Tell the breaker how a call ended and return its outcome. An error the
+    # provider answered with (is_failure false) still shows it is up.
+    def report(self, error: Exception = None) -> str:
+        if error is not None and self.is_failure(error):
+            self.breaker.failure()
+            return "failure"
+        self.breaker.success()
+        return "success" if error is None else "rejected"
+
+    def timed_out(self, message: str):
+        self.breaker.failure()
+        self.count("timeout")
+        return ProviderTimeout(message)
+
+    async def call(self, fn, *args, **kwargs):
+        try:
+            self.breaker.allow()
+        except CircuitOpenError:
+            self.count("short_circuited")
+            raise
+
+        async def guarded():
+            async with self.semaphore:
+                self.throttled_seconds += await self.bucket.acquire()
+                self.begin()
+                try:
+                    result = await fn(*args, **kwargs)
+                except Exception as e:
+                    self.count(self.report(e), finished=True)
+                    raise
+                except asyncio.CancelledError:
+                    self.count(None, finished=True)
+                    raise
+                self.count(self.report(), finished=True)
+                return result
+
+        try:
+            return await asyncio.wait_for(guarded(), self.timeout)
+        except asyncio.TimeoutError:
+            raise self.timed_out(f"{self.name} call timed out after {self.timeout}s") from None
+
+    def call_sync(self, fn, *args, **kwargs):
+        try:
+            self.breaker.allow()
+        except CircuitOpenError:
+            self.count("short_circuited")
+            raise
+        if not self.thread_semaphore.acquire(timeout=self.timeout):
+            raise self.timed_out(f"No free {self.name} slot within {self.timeout}s")
+        try:
+            self.throttled_seconds += self.bucket.acquire_sync()
+            self.begin()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                self.count(self.report(e), finished=True)
+                raise
+            self.count(self.report(), finished=True)
+            return result
+        finally:
+            self.thread_semaphore.release()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "state": self.breaker.state,
+                "in_flight": self.in_flight,
+                "calls": dict(self.calls),
+                "opened": self.breaker.opened_total,
+                "throttled_seconds": self.throttled_seconds,
+            }
@@ -0,0 +1,76 @@
+from datetime import datetime
+from sqlalchemy import Date, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import SalesRollup, session
+
+# Add sales quantities to their (day, product) buckets with one upsert.
+# Runs inside the caller's transaction so the rollup commits with the sales.
+async def record_sales(db: AsyncSession, sales: list):
+    buckets = {}
+    for pid, quantity, created_at in sales:
+        key = ((created_at or datetime.utcnow()).date(), pid)
+        buckets[key] = buckets.get(key, 0) + quantity
+
+    if not buckets:
+        return
+
+    dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(SalesRollup).values(
+        [{"day": day, "pid": pid, "quantity": quantity} for (day, pid), quantity in buckets.items()]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SalesRollup.day, SalesRollup.pid],
+        set_={"quantity": SalesRollup.quantity + stmt.excluded.quantity},
+    )
+    await db.execute(stmt)
+
+async def record_sale(db: AsyncSession, pid: int, quantity: int, created_at: datetime):
+    await record_sales(db, [(pid, quantity, created_at)])
+
+# Profit per product, from the rollup joined to current prices
+async def profit_per_product(db: AsyncSession):
+    result = await db.execute(text("""
+        SELECT p.name,
+               SUM((p.selling_price - p.buying_price) * r.quantity) AS profit
+        FROM sales_rollups r
+        JOIN products p ON r.pid = p.id
+        GROUP BY p.id
+    """))
+    return result.fetchall()
+
+# Sales per day, from the rollup joined to current prices.
+# Typed so SQLite (which stores dates as text) also returns date objects.
+async def sales_per_day(db: AsyncSession):
+    result = await db.execute(text("""
+        SELECT r.day AS date,
+               SUM(p.selling_price * r.quantity) AS sales
+        FROM sales_rollups r
+        JOIN products p ON r.pid = p.id
+        GROUP BY r.day
+        ORDER BY r.day
+    """).columns(date=Date))
+    return result.fetchall()
+
+# Recompute the whole rollup from the sales table (backfill / repair).
+# Synchronous: it runs from the command line, not from a request.
+def rebuild(db: Session):
+    db.execute(text("DELETE FROM sales_rollups"))
+    db.execute(text("""
+        INSERT INTO sales_rollups (day, pid, quantity)
+        SELECT DATE(s.created_at), s.pid, SUM(s.quantity)
+        FROM sales s
+        GROUP BY DATE(s.created_at), s.pid
+    """))
+    db.commit()
+
+# python -m app.rollups
+if __name__ == "__main__":
+    db = session()
+    try:
+        rebuild(db)
+        print("Sales rollup rebuilt")
+    finally:
+        db.close()
@@ -0,0 +1,40 @@
+# Stand-in for the Daraja endpoints used by app.mpesa, so STK pushes can be
+# benchmarked without the Safaricom sandbox.
+#   FAKE_DARAJA_LATENCY_MS=50 uvicorn benchmarks.fake_daraja:app --port 9100
+import asyncio
+import os
+import uuid
+
+from fastapi import FastAPI
+
+LATENCY_SECONDS = float(os.getenv("FAKE_DARAJA_LATENCY_MS", "50")) / 1000
+
+app = FastAPI()
+
+@app.get("/oauth/v1/generate")
+async def generate_token():
+    await asyncio.sleep(LATENCY_SECONDS)
+    return {"access_token": uuid.uuid4().hex, "expires_in": "3599"}
+
+@app.post("/mpesa/stkpush/v1/processrequest")
+async def stk_push(payload: dict):
+    await asyncio.sleep(LATENCY_SECONDS)
+    return {
+        "MerchantRequestID": "bench-mr-" + uuid.uuid4().hex,
+        "CheckoutRequestID": "ws_CO_bench_" + uuid.uuid4().hex,
+        "ResponseCode": "0",
+        "ResponseDescription": "Success. Request accepted for processing",
+        "CustomerMessage": "Success. Request accepted for processing",
+    }
+
+@app.post("/mpesa/stkpushquery/v1/query")
+async def stk_push_query(payload: dict):
+    await asyncio.sleep(LATENCY_SECONDS)
+    return {
+        "ResponseCode": "0",
+        "ResponseDescription": "The service request has been accepted successsfully",
+        "MerchantRequestID": "bench-mr-" + uuid.uuid4().hex,
+        "CheckoutRequestID": payload.get("CheckoutRequestID"),
+        "ResultCode": "1032",
+        "ResultDesc": "Request cancelled by user",
+    }
@@ -0,0 +1,291 @@
+# Benchmark the API hot paths against a seeded local database.
+#
+#   python -m benchmarks.run                          # seed SQLite, run every scenario
+#   python -m benchmarks.run --save baseline.json     # keep the results
+#   python -m benchmarks.run --compare baseline.json  # fail on p95/RPS regressions
+#
+# The app runs under uvicorn in a subprocess with metrics enabled, so the
+# per-request query count comes from its Server-Timing header. STK pushes go
+# to a fake Daraja server (benchmarks/fake_daraja.py) on a local port.
+# --database-url may point at Postgres, but its tables are emptied and reseeded
+# unless --no-seed is given.
+import argparse
+import asyncio
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_TIMING_QUERIES = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries"')
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+def start_server(target: str, port: int, env: dict, workers: int = 1):
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", target, "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=ROOT,
+        env=env,
+    )
+
+def wait_until_ready(url: str, process, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not start within {timeout}s")
+
+def callback_payload(crid: str, i: int):
+    return {
+        "Body": {
+            "stkCallback": {
+                "MerchantRequestID": f"bench-mr-{i}",
+                "CheckoutRequestID": crid,
+                "ResultCode": 0,
+                "ResultDesc": "The service request is processed successfully.",
+                "CallbackMetadata": {
+                    "Item": [
+                        {"Name": "Amount", "Value": 100},
+                        {"Name": "MpesaReceiptNumber", "Value": f"BNCB{i:07d}"},
+                        {"Name": "PhoneNumber", "Value": 254700000000},
+                    ]
+                },
+            }
+        }
+    }
+
+# name -> (method, url, body factory taking the request number, authenticated)
+def build_scenarios(args, pending_crid, bench_email, bench_password):
+    pending = max(args.payments // 2, 1)
+    return {
+        "sales": ("GET", "/sales?limit=100", None, True),
+        "payments": ("GET", "/payments?limit=100", None, True),
+        "dashboard": ("GET", "/dashboard", None, True),
+        "login": ("POST", "/auth/login",
+                  lambda i: {"email": bench_email(i % args.users + 1), "password": bench_password}, False),
+        "stkpush": ("POST", "/mpesa/stkpush",
+                    lambda i: {"amount": 10, "phone_number": "254700000000", "sale_id": i % args.sales + 1}, True),
+        "callback": ("POST", "/mpesa/callback",
+                     lambda i: callback_payload(pending_crid(2 * (i % pending) + 1), i), False),
+    }
+
+# `concurrency` clients share one request counter; warm-up requests run first and are not measured
+async def run_scenario(client, method, url, body, headers, requests: int, concurrency: int, warmup: int):
+    latencies = []
+    queries = []
+    errors = 0
+
+    async def worker(counter, measure: bool):
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            res = await client.request(method, url, json=body(i) if body else None, headers=headers)
+            elapsed = time.perf_counter() - start
+            if not measure:
+                continue
+            if res.status_code >= 400:
+                errors += 1
+            latencies.append(elapsed)
+            match = SERVER_TIMING_QUERIES.search(res.headers.get("server-timing", ""))
+            if match:
+                queries.append(int(match.group(1)))
+
+    counter = iter(range(warmup))
+    await asyncio.gather(*(worker(counter, False) for _ in range(concurrency)))
+
+    counter = iter(range(warmup, warmup + requests))
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(counter, True) for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / wall, 1),
+        "p50_ms": round(cuts[49] * 1000, 2),
+        "p95_ms": round(cuts[94] * 1000, 2),
+        "p99_ms": round(cuts[98] * 1000, 2),
+        "queries_per_request": round(statistics.mean(queries), 2) if queries else None,
+    }
+
+async def run_all(base_url, scenarios, login: dict, args):
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        res = await client.post("/auth/login", json=login)
+        res.raise_for_status()
+        auth = {"Authorization": "Bearer " + res.json()["access_token"]}
+
+        results = {}
+        for name, (method, url, body, authenticated) in scenarios.items():
+            print(f"  {name:<10} {method} {url}", flush=True)
+            results[name] = await run_scenario(
+                client, method, url, body, auth if authenticated else None,
+                args.requests, args.concurrency, args.warmup,
+            )
+        return results
+
+def print_results(results: dict):
+    print()
+    print(f"{'scenario':<10} {'reqs':>6} {'errors':>6} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8}")
+    for name, r in results.items():
+        q = "-" if r["queries_per_request"] is None else r["queries_per_request"]
+        print(f"{name:<10} {r['requests']:>6} {r['errors']:>6} {r['rps']:>9} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9} {q:>8}")
+
+# Print the change against a saved run; a scenario regresses when its p95 grows
+# or its RPS drops by more than `threshold` percent, or it issues more queries.
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    print()
+    print(f"Compared with {baseline['meta'].get('revision')} ({baseline['meta'].get('date')}), threshold {threshold}%")
+    print(f"{'scenario':<10} {'p50':>9} {'p95':>9} {'p99':>9} {'rps':>9} {'queries':>9}")
+    regressed = False
+
+    def change(new, old):
+        return (new - old) / old * 100 if old else 0.0
+
+    for name, r in results.items():
+        old = baseline["results"].get(name)
+        if not old:
+            print(f"{name:<10} (not in baseline)")
+            continue
+        deltas = {key: change(r[key], old[key]) for key in ("p50_ms", "p95_ms", "p99_ms", "rps")}
+        more_queries = (r["queries_per_request"] or 0) > (old["queries_per_request"] or 0)
+        flag = deltas["p95_ms"] > threshold or -deltas["rps"] > threshold or more_queries
+        regressed = regressed or flag
+        queries = f"{old['queries_per_request']}->{r['queries_per_request']}"
+        print(
+            f"{name:<10} {deltas['p50_ms']:>+8.1f}% {deltas['p95_ms']:>+8.1f}% {deltas['p99_ms']:>+8.1f}% "
+            f"{deltas['rps']:>+8.1f}% {queries:>9}{'  REGRESSION' if flag else ''}"
+        )
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the duka API hot paths")
+    parser.add_argument("--database-url", help="Database to seed and run against (default: a temporary SQLite file)")
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--sales", type=int, default=50000)
+    parser.add_argument("--payments", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--no-seed", action="store_true", help="Reuse the data already in --database-url")
+    parser.add_argument("--requests", type=int, default=500, help="Measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=50, help="Unmeasured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--daraja-latency-ms", type=float, default=50)
+    parser.add_argument("--bcrypt-rounds", type=int, default=int(os.getenv("BCRYPT_ROUNDS", "12")))
+    parser.add_argument("--only", help="Comma-separated scenarios: sales,payments,dashboard,login,stkpush,callback")
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Compare with results saved by --save; exits 1 on regression")
+    parser.add_argument("--threshold", type=float, default=10, help="Regression threshold in percent")
+    args = parser.parse_args()
+
+    database_url = args.database_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="duka-bench-"), "bench.db")
+    daraja_port = free_port()
+    app_port = free_port()
+
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": database_url,
+        "MPESA_BASE_URL": f"http://127.0.0.1:{daraja_port}",
+        "METRICS_ENABLED": "true",
+        "SERVER_TIMING_ENABLED": "true",
+        "BCRYPT_ROUNDS": str(args.bcrypt_rounds),
+        "FAKE_DARAJA_LATENCY_MS": str(args.daraja_latency_ms),
+    })
+    for key, value in {
+        "SECRET_KEY": "bench-secret",
+        "ALGORITHM": "HS256",
+        "ACCESS_TOKEN_EXPIRE_MINUTES": "60",
+        "AT_USERNAME": "sandbox",
+        "AT_API_KEY": "bench",
+        # Measure the app, not the rate limits: every benchmark client shares one IP
+        "MPESA_RATE_PER_SECOND": "0",
+        "RATE_LIMIT_ENABLED": "false",
+    }.items():
+        env.setdefault(key, value)
+    # The async driver URL must follow --database-url
+    env.pop("ASYNC_DATABASE_URL", None)
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    os.environ.update(env)
+
+    # Imported after the environment is set: app.models reads DATABASE_URL on import
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    from benchmarks.seed import seed, pending_crid, bench_email, BENCH_PASSWORD
+
+    if not args.no_seed:
+        print(f"Seeding {database_url}: {args.products} products, {args.sales} sales, "
+              f"{args.payments} payments, {args.users} users", flush=True)
+        seed(args.products, args.sales, args.payments, args.users, args.bcrypt_rounds)
+
+    scenarios = build_scenarios(args, pending_crid, bench_email, BENCH_PASSWORD)
+    if args.only:
+        scenarios = {name: scenarios[name] for name in args.only.split(",")}
+
+    daraja = start_server("benchmarks.fake_daraja:app", daraja_port, env)
+    api = start_server("app.main:app", app_port, env, args.workers)
+    try:
+        wait_until_ready(f"http://127.0.0.1:{daraja_port}/docs", daraja)
+        wait_until_ready(f"http://127.0.0.1:{app_port}/", api)
+        print(f"Running {args.requests} requests per scenario at concurrency {args.concurrency}", flush=True)
+        login = {"email": bench_email(1), "password": BENCH_PASSWORD}
+        results = asyncio.run(run_all(f"http://127.0.0.1:{app_port}", scenarios, login, args))
+    finally:
+        for process in (api, daraja):
+            process.terminate()
+            process.wait(timeout=30)
+
+    print_results(results)
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "date": datetime.utcnow().isoformat(timespec="seconds"),
+            "database": database_url.split(":", 1)[0],
+            "products": args.products,
+            "sales": args.sales,
+            "payments": args.payments,
+            "users": args.users,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "workers": args.workers,
+        },
+        "results": results,
+    }
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
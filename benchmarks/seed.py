@@ -0,0 +1,88 @@
+# Fill a throwaway database with benchmark data.
+# DATABASE_URL must be set before this module is imported (app.models reads it).
+import random
+from datetime import datetime, timedelta
+
+import bcrypt
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import insert, text
+
+from app.models import Product, Sale, User, Payment, engine, session
+from app.rollups import rebuild
+
+BENCH_PASSWORD = "bench-password"
+SEED_CHUNK_SIZE = 5000
+SEED_DAYS = 90
+
+def bench_email(i: int) -> str:
+    return f"bench{i}@example.com"
+
+# Pending payments the callback scenario completes
+def pending_crid(i: int) -> str:
+    return f"ws_CO_bench_pending_{i}"
+
+def insert_chunks(db, model, rows):
+    for start in range(0, len(rows), SEED_CHUNK_SIZE):
+        db.execute(insert(model), rows[start:start + SEED_CHUNK_SIZE])
+
+def seed(products: int, sales: int, payments: int, users: int, bcrypt_rounds: int, rng_seed: int = 42):
+    rng = random.Random(rng_seed)
+    command.upgrade(Config("alembic.ini"), "head")
+
+    db = session()
+    try:
+        for table in ("payments", "sales_details", "sales_rollups", "sales", "otps", "notifications", "users", "products"):
+            db.execute(text(f"DELETE FROM {table}"))
+
+        insert_chunks(db, Product, [
+            {"id": i, "name": f"Product {i}", "buying_price": price, "selling_price": round(price * 1.3, 2)}
+            for i, price in ((i, round(rng.uniform(10, 5000), 2)) for i in range(1, products + 1))
+        ])
+
+        now = datetime.utcnow()
+        insert_chunks(db, Sale, [
+            {
+                "id": i,
+                "pid": rng.randint(1, products),
+                "quantity": rng.randint(1, 10),
+                "created_at": now - timedelta(seconds=rng.randint(0, SEED_DAYS * 86400)),
+            }
+            for i in range(1, sales + 1)
+        ])
+
+        # Every user shares one hash; hashing each would dominate seeding time
+        password = bcrypt.hashpw(BENCH_PASSWORD.encode(), bcrypt.gensalt(rounds=bcrypt_rounds)).decode()
+        insert_chunks(db, User, [
+            {"id": i, "full_name": f"Bench User {i}", "email": bench_email(i), "phone": f"2547{i:08d}", "password": password}
+            for i in range(1, users + 1)
+        ])
+
+        # Half the payments are still PENDING so callbacks have something to apply
+        insert_chunks(db, Payment, [
+            {
+                "id": i,
+                "sale_id": rng.randint(1, sales),
+                "mrid": f"bench-mr-{i}",
+                "crid": pending_crid(i) if i % 2 else f"ws_CO_bench_done_{i}",
+                "amount": 0 if i % 2 else rng.randint(10, 5000),
+                "trans_code": "PENDING" if i % 2 else f"BNC{i:07d}",
+                "created_at": now - timedelta(seconds=rng.randint(0, SEED_DAYS * 86400)),
+            }
+            for i in range(1, payments + 1)
+        ])
+
+        # Explicit ids bypass the Postgres sequences; move them past the seeded rows
+        if engine.dialect.name == "postgresql":
+            for table in ("products", "sales", "users", "payments"):
+                db.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE((SELECT MAX(id) FROM {table}), 1))"))
+        db.commit()
+
+        rebuild(db)
+    finally:
+        db.close()
+
+    # Let Postgres see the new row counts before planning the benchmark queries
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("ANALYZE"))
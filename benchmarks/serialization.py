@@ -0,0 +1,113 @@
+# CPU cost of turning a page of list-endpoint rows into a response body,
+# the default path against the fast JSON path (FAST_JSON_ENABLED).
+#
+#   python -m benchmarks.serialization                   # 100 and 1000 rows
+#   python -m benchmarks.serialization --rows 5000 --repeat 50
+#
+# Rows are real SQLAlchemy rows from the endpoints' own queries on an
+# in-memory SQLite database. The default path is what a route does today:
+# build the per-row models, let FastAPI validate and serialize them against
+# the route's response_model, and encode with json.dumps. The fast path turns
+# the rows into dicts and encodes them with orjson.
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_rows(models, queries, count: int):
+    from sqlalchemy import create_engine, insert
+
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(engine)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(models.Product), [
+            {"id": i, "name": f"Product {i}", "buying_price": 10.0 * i, "selling_price": 13.5 * i}
+            for i in range(1, 51)
+        ])
+        conn.execute(insert(models.Sale), [
+            {"id": i, "pid": i % 50 + 1, "quantity": i % 7 + 1, "created_at": now - timedelta(minutes=i)}
+            for i in range(1, count + 1)
+        ])
+        conn.execute(insert(models.Payment), [
+            {"id": i, "sale_id": i, "mrid": f"mr-{i}", "crid": f"ws_CO_{i}", "amount": 100.0,
+             "trans_code": f"QK{i:08d}", "created_at": now - timedelta(minutes=i)}
+            for i in range(1, count + 1)
+        ])
+        return {
+            name: conn.execute(query.order_by(id_column).limit(count)).all()
+            for name, (query, id_column) in queries.items()
+        }
+
+# CPU seconds per call of fn, best of `repeat` after one warm-up call
+def measure(fn, repeat: int) -> float:
+    fn()
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.process_time()
+        fn()
+        best = min(best, time.process_time() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare list-endpoint serialization paths")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+
+    # app.models and app.main read their settings on import
+    for key, value in {
+        "DATABASE_URL": "sqlite://",
+        "SECRET_KEY": "bench-secret",
+        "ALGORITHM": "HS256",
+        "ACCESS_TOKEN_EXPIRE_MINUTES": "60",
+        "AT_USERNAME": "sandbox",
+        "AT_API_KEY": "bench",
+    }.items():
+        os.environ.setdefault(key, value)
+    sys.path.insert(0, ROOT)
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    import app.models as models
+    from app.main import app, sales_query, payments_query, SaleDataResponse, PaymentDataResponse
+    from app.responses import ORJSONResponse, row_dicts
+
+    routes = {route.path: route for route in app.routes if getattr(route, "methods", None) == {"GET"}}
+    endpoints = {
+        "sales": (sales_query(), models.Sale.id, SaleDataResponse, routes["/sales"]),
+        "payments": (payments_query(), models.Payment.id, PaymentDataResponse, routes["/payments"]),
+    }
+
+    loop = asyncio.new_event_loop()
+    print(f"{'endpoint':<10} {'rows':>6} {'default ms':>11} {'fast ms':>9} {'default us/row':>15} {'fast us/row':>12} {'speedup':>8}")
+    for count in args.rows:
+        all_rows = load_rows(models, {name: (q, c) for name, (q, c, _, _) in endpoints.items()}, count)
+        for name, (_, _, model, route) in endpoints.items():
+            rows = all_rows[name]
+
+            def default_path():
+                content = [model(**row._mapping) for row in rows]
+                content = loop.run_until_complete(serialize_response(field=route.response_field, response_content=content))
+                return JSONResponse(content).body
+
+            def fast_path():
+                return ORJSONResponse(row_dicts(rows)).body
+
+            # Both paths must produce the same document
+            assert json.loads(default_path()) == json.loads(fast_path()), f"{name}: outputs differ"
+
+            default_best = measure(default_path, args.repeat)
+            fast_best = measure(fast_path, args.repeat)
+            print(
+                f"{name:<10} {len(rows):>6} {default_best * 1000:>11.2f} {fast_best * 1000:>9.2f} "
+                f"{default_best / len(rows) * 1e6:>15.2f} {fast_best / len(rows) * 1e6:>12.2f} "
+                f"{default_best / fast_best:>7.1f}x"
+            )
+
+if __name__ == "__main__":
+    main()
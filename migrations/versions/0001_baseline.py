@@ -0,0 +1,94 @@
+"""baseline schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 09:00:00
+
+The schema as it was when tables were created with Base.metadata.create_all.
+Databases created that way already have these tables, so existing ones are
+left untouched and `alembic upgrade head` works on them without a stamp.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'products' not in existing:
+        op.create_table(
+            'products',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('name', sa.String(), nullable=False),
+            sa.Column('buying_price', sa.Float(), nullable=False),
+            sa.Column('selling_price', sa.Float(), nullable=False),
+        )
+
+    if 'sales' not in existing:
+        op.create_table(
+            'sales',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('pid', sa.Integer(), sa.ForeignKey('products.id'), nullable=False),
+            sa.Column('quantity', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime()),
+        )
+
+    if 'sales_details' not in existing:
+        op.create_table(
+            'sales_details',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('sale_id', sa.Integer(), sa.ForeignKey('sales.id'), nullable=False),
+            sa.Column('product_id', sa.Integer(), nullable=False),
+            sa.Column('quantity', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime()),
+        )
+
+    if 'users' not in existing:
+        op.create_table(
+            'users',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('full_name', sa.String(), nullable=False),
+            sa.Column('email', sa.String(), nullable=False),
+            sa.Column('phone', sa.String(), nullable=True),
+            sa.Column('password', sa.String(), nullable=False),
+            sa.Column('created_at', sa.DateTime()),
+            sa.Column('updated_at', sa.DateTime()),
+        )
+        op.create_index('ix_users_id', 'users', ['id'])
+        op.create_index('ix_users_email', 'users', ['email'], unique=True)
+
+    if 'otps' not in existing:
+        op.create_table(
+            'otps',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+            sa.Column('otp', sa.String(4), nullable=False),
+            sa.Column('created_at', sa.DateTime()),
+        )
+
+    if 'payments' not in existing:
+        op.create_table(
+            'payments',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('sale_id', sa.Integer(), sa.ForeignKey('sales.id'), nullable=False),
+            sa.Column('mrid', sa.String(100), nullable=False),
+            sa.Column('crid', sa.String(100), nullable=False),
+            sa.Column('amount', sa.Float(), nullable=True),
+            sa.Column('trans_code', sa.String(100), nullable=True),
+            sa.Column('created_at', sa.DateTime()),
+        )
+
+
+def downgrade():
+    op.drop_table('payments')
+    op.drop_table('otps')
+    op.drop_table('users')
+    op.drop_table('sales_details')
+    op.drop_table('sales')
+    op.drop_table('products')
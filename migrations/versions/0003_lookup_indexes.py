@@ -0,0 +1,48 @@
+"""indexes for the hot lookup columns
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 09:10:00
+
+On Postgres the indexes are built CONCURRENTLY so sales and payments keep
+taking writes during the deploy. That cannot run inside a transaction, so
+each one gets its own autocommit block. If a concurrent build fails it leaves
+an INVALID index behind: drop it and run the upgrade again.
+"""
+from alembic import op
+
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+# (name, table, columns, unique)
+INDEXES = [
+    ('ix_sales_pid', 'sales', ['pid'], False),                 # product filters, rollup rebuild
+    ('ix_sales_created_at', 'sales', ['created_at'], False),   # date-range listings and exports
+    ('ix_payments_sale_id', 'payments', ['sale_id'], False),   # /mpesa/checker and /mpesa/status
+    ('ix_payments_crid', 'payments', ['crid'], True),          # M-Pesa callback lookup
+    ('ix_payments_mrid_crid', 'payments', ['mrid', 'crid'], False),
+    ('ix_payments_created_at', 'payments', ['created_at'], False),
+    ('ix_users_phone', 'users', ['phone'], False),             # forgot_password by SMS
+    ('ix_users_created_at', 'users', ['created_at'], False),
+]
+
+
+def upgrade():
+    for name, table, columns, unique in INDEXES:
+        with op.get_context().autocommit_block():
+            op.create_index(
+                name, table, columns,
+                unique=unique,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade():
+    for name, table, columns, unique in reversed(INDEXES):
+        with op.get_context().autocommit_block():
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,33 @@
+"""index for finding stale pending payments
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 12:00:00
+
+Built CONCURRENTLY on Postgres, as in 0003.
+"""
+from alembic import op
+
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_payments_trans_code_created_at', 'payments', ['trans_code', 'created_at'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_payments_trans_code_created_at', table_name='payments',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
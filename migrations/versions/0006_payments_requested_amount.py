@@ -0,0 +1,25 @@
+"""amount requested in the STK push
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 13:00:00
+
+Lets the reconciler settle a payment from an STK push query, which
+reports success without the amount.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('payments', sa.Column('requested_amount', sa.Float(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('payments', 'requested_amount')
@@ -0,0 +1,75 @@
+# Tests run the app against a throwaway SQLite database (aiosqlite for the
+# async engine) migrated with Alembic, with the background workers that would
+# reach external services switched off.
+import os
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Set before any app module is imported: app.config reads the environment on import
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ.update({
+    "DATABASE_URL": "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="duka-tests-"), "test.db"),
+    "SECRET_KEY": "test-secret",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "60",
+    "AT_USERNAME": "sandbox",
+    "AT_API_KEY": "test",
+    "BCRYPT_ROUNDS": "4",
+    "MPESA_BASE_URL": "http://127.0.0.1:9",
+    "NOTIFY_POLL_SECONDS": "3600",
+    "RECONCILE_ENABLED": "false",
+    "RATE_LIMIT_ENABLED": "false",
+    "CACHE_ENABLED": "false",
+    "FAKE_DARAJA_LATENCY_MS": "0",
+})
+
+import pytest
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import event, insert
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    config = Config(os.path.join(ROOT, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(ROOT, "migrations"))
+    command.upgrade(config, "head")
+
+@pytest.fixture(scope="session")
+def client(database):
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as c:
+        yield c
+
+@pytest.fixture(scope="session")
+def auth_headers(client):
+    user = {"full_name": "Test User", "email": "tester@example.com", "password": "test-password"}
+    res = client.post("/auth/register", json=user)
+    assert res.status_code == 200, res.text
+    return {"Authorization": "Bearer " + res.json()["access_token"]}
+
+# Insert rows (with explicit ids) through the sync engine
+@pytest.fixture(scope="session")
+def insert_rows(database):
+    from app.models import engine
+
+    def insert_rows(model, rows: list):
+        with engine.begin() as conn:
+            conn.execute(insert(model), rows)
+    return insert_rows
+
+# SQL statements the routes' async engine executes while the test runs
+@pytest.fixture
+def statements():
+    from app.models import async_engine
+
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(async_engine.sync_engine, "before_cursor_execute", record)
@@ -0,0 +1,34 @@
+import asyncio
+
+from app.cache import MemoryCacheBackend, ReadCache
+
+# A load that was running when its namespace was invalidated is returned
+# but not cached; the next read loads again
+def test_load_overlapping_invalidation_is_not_cached():
+    cache = ReadCache(MemoryCacheBackend(), ttl=60, enabled=True)
+    loads = []
+
+    async def run():
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def slow_loader():
+            loads.append("slow")
+            started.set()
+            await release.wait()
+            return "stale"
+
+        async def loader():
+            loads.append("fresh")
+            return "fresh"
+
+        pending = asyncio.create_task(cache.get_or_set("products", (1,), slow_loader))
+        await started.wait()
+        cache.invalidate("products")
+        release.set()
+        assert await pending == "stale"
+
+        assert await cache.get_or_set("products", (1,), loader) == "fresh"
+        assert await cache.get_or_set("products", (1,), loader) == "fresh"
+
+    asyncio.run(run())
+    assert loads == ["slow", "fresh"]
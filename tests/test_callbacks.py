@@ -0,0 +1,85 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from app import callbacks, reconciliation
+from app.callbacks import CallbackIngestor
+from app.models import Payment, Product, Sale, session
+
+@pytest.fixture(scope="module")
+def pending_payment(insert_rows):
+    insert_rows(Product, [{"id": 5001, "name": "Rice 2kg", "buying_price": 200, "selling_price": 240}])
+    insert_rows(Sale, [{"id": 5001, "pid": 5001, "quantity": 1, "created_at": datetime.utcnow()}])
+    insert_rows(Payment, [{"id": 5001, "sale_id": 5001, "mrid": "mr-5001", "crid": "ws_CO_callbacks_1",
+                           "amount": 0, "trans_code": "PENDING", "created_at": datetime.utcnow()}])
+    return "ws_CO_callbacks_1"
+
+# A batch that fails to apply is retried, not dropped
+def test_failed_batch_is_retried_until_applied(monkeypatch, pending_payment):
+    attempts = []
+    apply_callbacks = callbacks.apply_callbacks
+
+    async def flaky_apply(updates):
+        attempts.append(len(updates))
+        if len(attempts) < 3:
+            raise RuntimeError("database unavailable")
+        return await apply_callbacks(updates)
+
+    monkeypatch.setattr(callbacks, "apply_callbacks", flaky_apply)
+
+    async def run():
+        ingestor = CallbackIngestor(batch_wait_ms=1, retry_base=0.01, retry_max=0.02)
+        await ingestor.start()
+        await ingestor.submit({"mrid": "mr-5001", "crid": pending_payment, "amount": 240, "trans_code": "RCB5001"})
+        await ingestor.stop()
+
+    asyncio.run(run())
+    assert attempts == [1, 1, 1]
+    db = session()
+    try:
+        payment = db.get(Payment, 5001)
+        assert (payment.trans_code, payment.amount) == ("RCB5001", 240)
+    finally:
+        db.close()
+
+# A successful STK push query settles the payment for the amount pushed; a late
+# callback then fills in the receipt, but never overturns a failure
+def test_query_result_keeps_amount_and_late_receipt_is_applied(monkeypatch, insert_rows):
+    now = datetime.utcnow()
+    insert_rows(Product, [{"id": 5002, "name": "Sugar 1kg", "buying_price": 120, "selling_price": 150}])
+    insert_rows(Sale, [{"id": 5002, "pid": 5002, "quantity": 2, "created_at": now},
+                       {"id": 5003, "pid": 5002, "quantity": 1, "created_at": now}])
+    insert_rows(Payment, [
+        {"id": 5002, "sale_id": 5002, "mrid": "mr-5002", "crid": "ws_CO_callbacks_2",
+         "amount": 0, "trans_code": "PENDING", "requested_amount": 300, "created_at": now},
+        {"id": 5003, "sale_id": 5003, "mrid": "mr-5003", "crid": "ws_CO_callbacks_3",
+         "amount": 0, "trans_code": "PENDING", "requested_amount": 150, "created_at": now},
+    ])
+    results = {"ws_CO_callbacks_2": "0", "ws_CO_callbacks_3": "1032"}
+
+    async def query_stk_push(crid):
+        return {"MerchantRequestID": "mr", "CheckoutRequestID": crid, "ResultCode": results[crid]}
+
+    monkeypatch.setattr(reconciliation.mpesa_client, "query_stk_push", query_stk_push)
+
+    async def run():
+        reconciler = reconciliation.PaymentReconciler(rate=0)
+        updates = [await reconciler.check(crid, amount) for crid, amount in
+                   [("ws_CO_callbacks_2", 300), ("ws_CO_callbacks_3", 150)]]
+        assert len(await callbacks.apply_callbacks(updates)) == 2
+        # Safaricom's late callbacks, one of them for the failed push
+        late = [{"mrid": "mr", "crid": crid, "amount": amount, "trans_code": code}
+                for crid, amount, code in [("ws_CO_callbacks_2", 300, "RCB5002"), ("ws_CO_callbacks_3", 150, "RCB5003")]]
+        applied = await callbacks.apply_callbacks(late)
+        assert [u["crid"] for u in applied] == ["ws_CO_callbacks_2"]
+        # A repeat, or a receipt-less completion, changes nothing
+        assert await callbacks.apply_callbacks(late[:1]) == []
+
+    asyncio.run(run())
+    db = session()
+    try:
+        assert (db.get(Payment, 5002).trans_code, db.get(Payment, 5002).amount) == ("RCB5002", 300)
+        assert (db.get(Payment, 5003).trans_code, db.get(Payment, 5003).amount) == ("FAILED", 0)
+    finally:
+        db.close()
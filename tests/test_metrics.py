@@ -0,0 +1,26 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from app.metrics import RequestStats, current_request, instrument_engine
+
+# A statement that fails leaves nothing on the pooled connection, and the
+# next one is still timed and charged to the request
+def test_failed_statement_leaves_no_residue():
+    engine = create_engine("sqlite://")
+    instrument_engine(engine, "test")
+    stats = RequestStats()
+    token = current_request.set(stats)
+    try:
+        with engine.connect() as conn:
+            before = dict(conn.info)
+            for _ in range(3):
+                with pytest.raises(OperationalError):
+                    conn.execute(text("SELECT * FROM missing_table"))
+            assert conn.info == before
+
+            assert conn.execute(text("SELECT 1")).scalar() == 1
+    finally:
+        current_request.reset(token)
+    assert stats.queries == 1
+    assert stats.query_seconds > 0
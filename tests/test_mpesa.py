@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app import mpesa
+from app.mpesa import MpesaClient, push_api, stk_push_query_api, token_api
+from app.resilience import Provider
+from benchmarks import fake_daraja
+
+TOKEN_PATH = token_api.split("?")[0]
+
+# The fake Daraja app behind a transport that records every request and can
+# answer the next request to a path with a status code or an exception instead
+class FakeDarajaTransport(httpx.AsyncBaseTransport):
+    def __init__(self):
+        self.app = httpx.ASGITransport(app=fake_daraja.app)
+        self.requests = []
+        self.faults = []
+
+    def fail_next(self, path: str, *faults):
+        self.faults.extend((path, fault) for fault in faults)
+
+    def count(self, path: str) -> int:
+        return sum(1 for p in self.requests if p == path)
+
+    async def handle_async_request(self, request):
+        self.requests.append(request.url.path)
+        for i, (path, fault) in enumerate(self.faults):
+            if path == request.url.path:
+                del self.faults[i]
+                if isinstance(fault, Exception):
+                    raise fault
+                return httpx.Response(fault, json={"errorMessage": "injected"}, request=request)
+        return await self.app.handle_async_request(request)
+
+@pytest.fixture
+def daraja(monkeypatch):
+    monkeypatch.setattr(mpesa, "RETRY_BACKOFF_SECONDS", 0.01)
+    return FakeDarajaTransport()
+
+@pytest.fixture
+def client(daraja):
+    # A provider of its own, so circuit state does not leak between tests
+    provider = Provider("daraja-test", rate=0, burst=1, concurrency=50, timeout=5,
+                        failure_threshold=100, reset_seconds=30, is_failure=mpesa.daraja_failure)
+    client = MpesaClient(base_url="http://daraja.test", max_retries=2, provider=provider)
+    client.client = httpx.AsyncClient(base_url="http://daraja.test", transport=daraja)
+    return client
+
+def test_concurrent_pushes_fetch_one_token(client, daraja):
+    async def push_all():
+        return await asyncio.gather(*(client.send_stk_push(10, "254700000000", i) for i in range(20)))
+
+    results = asyncio.run(push_all())
+    assert all(r.get("CheckoutRequestID") for r in results)
+    assert daraja.count(TOKEN_PATH) == 1
+    assert daraja.count(push_api) == 20
+
+def test_rejected_token_is_refreshed_once(client, daraja):
+    async def run():
+        await client.send_stk_push(10, "254700000000", 1)
+        daraja.fail_next(push_api, 401)
+        return await client.send_stk_push(10, "254700000000", 2)
+
+    assert asyncio.run(run()).get("CheckoutRequestID")
+    assert daraja.count(TOKEN_PATH) == 2
+    assert daraja.count(push_api) == 3
+
+def test_query_retries_timeouts_and_5xx_with_backoff(client, daraja):
+    daraja.fail_next(stk_push_query_api, httpx.ReadTimeout("injected"), 503)
+    start = time.monotonic()
+    res = asyncio.run(client.query_stk_push("ws_CO_1"))
+    assert res["CheckoutRequestID"] == "ws_CO_1"
+    assert daraja.count(stk_push_query_api) == 3
+    # Backoff of 0.01s then 0.02s between the attempts
+    assert time.monotonic() - start >= 0.03
+
+def test_query_gives_up_after_max_retries(client, daraja):
+    daraja.fail_next(stk_push_query_api, 503, 503, 503)
+    res = asyncio.run(client.query_stk_push("ws_CO_1"))
+    assert "error" in res
+    assert daraja.count(stk_push_query_api) == 3
+
+@pytest.mark.parametrize("fault", [httpx.ReadTimeout("injected"), 503])
+def test_stk_push_is_not_retried_once_sent(client, daraja, fault):
+    daraja.fail_next(push_api, fault)
+    res = asyncio.run(client.send_stk_push(10, "254700000000", 1))
+    assert "error" in res
+    assert daraja.count(push_api) == 1
+
+def test_stk_push_is_retried_when_never_sent(client, daraja):
+    daraja.fail_next(push_api, httpx.ConnectError("injected"))
+    res = asyncio.run(client.send_stk_push(10, "254700000000", 1))
+    assert res.get("CheckoutRequestID")
+    assert daraja.count(push_api) == 2
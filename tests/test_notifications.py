@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import delete, update
+
+from app import notifications
+from app.models import Notification, session
+from app.resilience import Provider
+
+# Stands in for SMTPSender: records what it sends and fails while `failing`
+class StubSender:
+    def __init__(self, failing: int = 0):
+        self.failing = failing
+        self.sent = []
+        self.claimed_while_sending = []
+        self.closed = 0
+
+    def send(self, to, subject, body):
+        # The claim is committed before sending, so another session sees the lease
+        db = session()
+        try:
+            self.claimed_while_sending.append(
+                db.query(Notification.next_attempt_at).filter(Notification.recipient == to).scalar() > datetime.utcnow()
+            )
+        finally:
+            db.close()
+        if self.failing:
+            self.failing -= 1
+            raise OSError("connection reset")
+        self.sent.append((to, subject, body))
+
+    def close(self):
+        self.closed += 1
+
+@pytest.fixture
+def outbox(monkeypatch):
+    monkeypatch.setattr(notifications, "smtp_provider", Provider(
+        "smtp-test", rate=0, burst=1, concurrency=1, timeout=5, failure_threshold=5, reset_seconds=60,
+    ))
+    db = session()
+    try:
+        db.execute(delete(Notification))
+        db.commit()
+    finally:
+        db.close()
+
+def add_email(recipient: str):
+    db = session()
+    try:
+        db.add(Notification(channel="email", recipient=recipient, subject="Receipt", body="Thanks"))
+        db.commit()
+    finally:
+        db.close()
+
+def load(recipient: str) -> Notification:
+    db = session()
+    try:
+        return db.query(Notification).filter(Notification.recipient == recipient).one()
+    finally:
+        db.close()
+
+def make_due(recipient: str):
+    db = session()
+    try:
+        db.execute(update(Notification).where(Notification.recipient == recipient)
+                   .values(next_attempt_at=datetime.utcnow() - timedelta(seconds=1)))
+        db.commit()
+    finally:
+        db.close()
+
+def test_due_email_is_sent(outbox):
+    add_email("sent@example.com")
+    sender = StubSender()
+
+    assert notifications.dispatch_batch(sender) == 1
+    assert sender.sent == [("sent@example.com", "Receipt", "Thanks")]
+    assert sender.claimed_while_sending == [True]
+    row = load("sent@example.com")
+    assert (row.status, row.attempts) == ("sent", 1)
+    assert row.sent_at is not None
+
+    # Nothing is due any more
+    assert notifications.dispatch_batch(sender) == 0
+
+def test_failed_email_is_retried_with_backoff(outbox):
+    add_email("retry@example.com")
+    sender = StubSender(failing=1)
+
+    assert notifications.dispatch_batch(sender) == 1
+    row = load("retry@example.com")
+    assert (row.status, row.attempts, row.last_error) == ("pending", 1, "connection reset")
+    assert row.next_attempt_at > datetime.utcnow()
+    assert sender.closed == 1
+    assert notifications.dispatch_batch(sender) == 0
+
+    make_due("retry@example.com")
+    assert notifications.dispatch_batch(sender) == 1
+    row = load("retry@example.com")
+    assert (row.status, row.attempts) == ("sent", 2)
+    assert sender.sent == [("retry@example.com", "Receipt", "Thanks")]
+
+def test_open_circuit_defers_without_using_attempts(outbox):
+    for _ in range(notifications.smtp_provider.breaker.failure_threshold):
+        notifications.smtp_provider.breaker.failure()
+    add_email("deferred@example.com")
+    sender = StubSender()
+
+    assert notifications.dispatch_batch(sender) == 1
+    assert sender.sent == []
+    row = load("deferred@example.com")
+    assert (row.status, row.attempts) == ("pending", 0)
+    assert "unavailable" in row.last_error
+    assert row.next_attempt_at > datetime.utcnow() + timedelta(seconds=30)
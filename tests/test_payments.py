@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import Payment, Product, Sale
+
+@pytest.fixture(scope="module")
+def payments(insert_rows):
+    now = datetime.utcnow()
+    insert_rows(Product, [{"id": 4001, "name": "Bread", "buying_price": 50, "selling_price": 60}])
+    insert_rows(Sale, [
+        {"id": 4000 + i, "pid": 4001, "quantity": i, "created_at": now - timedelta(minutes=i)}
+        for i in range(1, 6)
+    ])
+    insert_rows(Payment, [
+        {"id": 4000 + i, "sale_id": 4000 + i, "mrid": f"mr-{i}", "crid": f"ws_CO_payments_{i}",
+         "amount": 60.0 * i, "trans_code": f"RCP{i:05d}", "created_at": now - timedelta(minutes=i)}
+        for i in range(1, 6)
+    ])
+
+def payment_statements(statements):
+    return [s for s in statements if "FROM payments" in s]
+
+# Regression test for the old per-payment sale and product lookups:
+# each page is one joined query
+def test_payments_page_is_one_query(client, auth_headers, payments, statements):
+    res = client.get("/payments", params={"limit": 2, "after": 4000}, headers=auth_headers)
+    assert res.status_code == 200
+    assert len(payment_statements(statements)) == 1
+    assert [p["id"] for p in res.json()] == [4001, 4002]
+
+    statements.clear()
+    res = client.get("/payments", params={"limit": 2, "after": res.headers["X-Next-Cursor"]}, headers=auth_headers)
+    assert len(payment_statements(statements)) == 1
+    assert [p["id"] for p in res.json()] == [4003, 4004]
+
+def test_payments_rows_carry_sale_details(client, auth_headers, payments):
+    res = client.get("/payments", params={"sale_id": 4003}, headers=auth_headers)
+    [row] = res.json()
+    assert row["trans_code"] == "RCP00003"
+    assert row["product_name"] == "Bread"
+    assert row["sale_amount"] == 3 * 60
@@ -0,0 +1,41 @@
+import json
+
+from app import product_import
+from app.models import Product, session
+
+# Products have no created_at, so the list must not offer date filters
+def test_products_schema_has_no_date_filters(client):
+    params = client.get("/openapi.json").json()["paths"]["/products"]["get"]["parameters"]
+    assert {p["name"] for p in params} == {"limit", "after"}
+
+def test_products_pages_by_cursor(client, auth_headers, insert_rows):
+    insert_rows(Product, [
+        {"id": 3000 + i, "name": f"Product {i}", "buying_price": 10, "selling_price": 12}
+        for i in range(1, 4)
+    ])
+    res = client.get("/products", params={"limit": 2, "after": 3000}, headers=auth_headers)
+    assert [p["id"] for p in res.json()] == [3001, 3002]
+    assert res.headers["X-Next-Cursor"] == "3002"
+
+# Batches written before a malformed part of the upload stay written, and the
+# response says so
+def test_truncated_import_reports_written_batches(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(product_import, "IMPORT_BATCH_SIZE", 2)
+    rows = [
+        json.dumps({"id": 3100 + i, "name": f"Imported {i}", "buying_price": 10, "selling_price": 12})
+        for i in range(1, 4)
+    ]
+    body = "[" + ",".join(rows) + ',{"id": 3104, "name": "Trunc'
+    res = client.post("/products/import", content=body,
+                      headers={**auth_headers, "Content-Type": "application/json"})
+
+    assert res.status_code == 400
+    report = res.json()
+    assert report["error"] == "Invalid or truncated JSON array"
+    assert (report["processed"], report["written"], report["errors"]) == (3, 2, [])
+
+    db = session()
+    try:
+        assert [p.id for p in db.query(Product).filter(Product.id.between(3101, 3104)).order_by(Product.id)] == [3101, 3102]
+    finally:
+        db.close()
@@ -0,0 +1,42 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from app.auth.revocation import TokenRevocations
+from app.config import ACCESS_TOKEN_EXPIRE_MINUTES
+from app.models import User
+
+# Only users revoked within a token lifetime are loaded; older cutoffs can
+# no longer match a live token
+def test_refresh_skips_revocations_older_than_a_token(insert_rows):
+    now = datetime.utcnow()
+    lifetime = timedelta(minutes=int(ACCESS_TOKEN_EXPIRE_MINUTES))
+    insert_rows(User, [
+        {"id": 6001, "full_name": "Recent", "email": "recent-reset@example.com", "password": "x",
+         "tokens_revoked_at": now - lifetime / 2},
+        {"id": 6002, "full_name": "Old", "email": "old-reset@example.com", "password": "x",
+         "tokens_revoked_at": now - lifetime * 2},
+        {"id": 6003, "full_name": "Never", "email": "never-reset@example.com", "password": "x",
+         "tokens_revoked_at": None},
+    ])
+
+    revocations = TokenRevocations()
+    asyncio.run(revocations.refresh())
+
+    assert "recent-reset@example.com" in revocations.users
+    assert "old-reset@example.com" not in revocations.users
+    assert "never-reset@example.com" not in revocations.users
+
+# A revocation whose transaction commits only after a refresh has read
+# survives that refresh
+def test_refresh_keeps_revocations_it_may_have_read_too_early():
+    revocations = TokenRevocations()
+    user = User(full_name="Slow", email="slow-commit@example.com", password="x")
+    revocations.revoke_user(user)
+    payload = {"sub": user.email, "iat": revocations.users[user.email] - 1}
+
+    asyncio.run(revocations.refresh())
+    assert revocations.is_revoked(payload)
+
+    # Never committed: dropped once a later refresh has had the chance to read it
+    asyncio.run(revocations.refresh())
+    assert not revocations.is_revoked(payload)
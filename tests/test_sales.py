@@ -0,0 +1,56 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import Product, Sale
+
+@pytest.fixture(scope="module")
+def sales(insert_rows):
+    now = datetime.utcnow()
+    insert_rows(Product, [
+        {"id": 2001, "name": "Sugar 1kg", "buying_price": 150, "selling_price": 180},
+        {"id": 2002, "name": "Milk 500ml", "buying_price": 50, "selling_price": 65},
+    ])
+    insert_rows(Sale, [
+        {"id": 2000 + i, "pid": 2001 + i % 2, "quantity": i, "created_at": now - timedelta(minutes=i)}
+        for i in range(1, 6)
+    ])
+    return {"pid": 2002}
+
+def sales_statements(statements):
+    return [s for s in statements if "FROM sales" in s]
+
+# One joined query per page, however many rows it returns
+def test_sales_page_is_one_query(client, auth_headers, sales, statements):
+    res = client.get("/sales", params={"limit": 2, "after": 2000}, headers=auth_headers)
+    assert res.status_code == 200
+    assert len(sales_statements(statements)) == 1
+    assert [s["id"] for s in res.json()] == [2001, 2002]
+
+    statements.clear()
+    res = client.get("/sales", params={"limit": 2, "after": res.headers["X-Next-Cursor"]}, headers=auth_headers)
+    assert len(sales_statements(statements)) == 1
+    assert [s["id"] for s in res.json()] == [2003, 2004]
+
+def test_sales_rows_carry_product_and_amount(client, auth_headers, sales):
+    res = client.get("/sales", params={"pid": sales["pid"], "after": 2000}, headers=auth_headers)
+    rows = res.json()
+    assert [s["id"] for s in rows] == [2001, 2003, 2005]
+    assert rows[1]["product_name"] == "Milk 500ml"
+    assert rows[1]["product_sp"] == 65
+    assert rows[1]["amount"] == 3 * 65
+
+# Lines sent without a timestamp are stamped when they arrive, not when the
+# app started
+def test_batches_without_timestamps_get_their_own_time(client, auth_headers, sales):
+    stamps = []
+    for _ in range(2):
+        before = datetime.utcnow()
+        res = client.post("/sales/batch", json={"sales": [{"pid": 2001, "quantity": 1}]}, headers=auth_headers)
+        assert res.status_code == 200
+        created_at = datetime.fromisoformat(res.json()[0]["created_at"])
+        assert created_at >= before
+        stamps.append(created_at)
+        time.sleep(0.01)
+    assert stamps[0] < stamps[1]